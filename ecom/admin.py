@@ -8,4 +8,6 @@ admin.site.register(Cart)
 admin.site.register(Payment)
 admin.site.register(NNotification)
 admin.site.register(PaymentMethod)
+admin.site.register(StockReservation)
+admin.site.register(Job)
 # Register your models here.
@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, Round, TruncDate
+from django.utils import timezone
+
+from .models import Payment, ProductDailySales, SellerDailySales
+
+
+# Longest date range a dashboard request may ask for, in days.
+ANALYTICS_MAX_DAYS = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+ANALYTICS_DEFAULT_DAYS = getattr(settings, 'ANALYTICS_DEFAULT_DAYS', 30)
+
+METRICS = ['revenue', 'units', 'orders']
+
+
+def payment_totals(payments):
+    """
+    ``payments`` grouped by product and day. Payments carry no quantity,
+    so units are ``amount / unit_price`` (one for free products).
+    """
+    units = Coalesce(Round(F('amount') / NullIf(F('unit_price'), Value(0.0))), Value(1.0))
+    return (
+        payments.annotate(day=TruncDate('date'))
+        .values('product', 'product__user', 'day')
+        .annotate(revenue=Sum('amount'), units=Sum(units), orders=Count('pk'))
+        .order_by()
+    )
+
+
+def product_sales(row):
+    return ProductDailySales(
+        product_id=row['product'],
+        seller_id=row['product__user'],
+        day=row['day'],
+        revenue=row['revenue'],
+        units=int(row['units']),
+        orders=row['orders'],
+    )
+
+
+def seller_totals(product_sales):
+    return (
+        product_sales.values('seller', 'day')
+        .annotate(total_revenue=Sum('revenue'), total_units=Sum('units'), total_orders=Sum('orders'))
+        .order_by()
+    )
+
+
+def seller_sales(row):
+    return SellerDailySales(
+        seller_id=row['seller'],
+        day=row['day'],
+        revenue=row['total_revenue'],
+        units=row['total_units'],
+        orders=row['total_orders'],
+    )
+
+
+def upsert(model, rows, unique_fields):
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+    if not connection.features.supports_update_conflicts_with_target:
+        unique_fields = None
+    model.objects.bulk_create(rows, batch_size=1000, update_conflicts=True, unique_fields=unique_fields, update_fields=METRICS)
+
+
+@transaction.atomic
+def record_sales(payment_ids):
+    """
+    Brings the rollups of the products and days of ``payment_ids`` up to
+    date. The touched buckets are recounted from Payment rather than
+    incremented, so a rerun never counts a payment twice; the cost is one
+    GROUP BY over those products' payments on those days. Returns the
+    number of product rollups written.
+    """
+    keys = (
+        Payment.objects.filter(pk__in=payment_ids)
+        .annotate(day=TruncDate('date'))
+        .values_list('product', 'product__user', 'day')
+        .distinct()
+    )
+    products, sellers, days = set(), set(), set()
+    for product, seller, day in keys:
+        products.add(product)
+        sellers.add(seller)
+        days.add(day)
+    if not products:
+        return 0
+    # Recounts of the same seller wait for each other, so a slower one can
+    # not overwrite a newer total with an older snapshot.
+    list(User.objects.select_for_update().filter(pk__in=sellers).values_list('pk', flat=True))
+
+    rows = [product_sales(row) for row in payment_totals(Payment.objects.filter(product__in=products, date__date__in=days))]
+    upsert(ProductDailySales, rows, ['product', 'day'])
+    touched = ProductDailySales.objects.filter(seller__in=sellers, day__in=days)
+    upsert(SellerDailySales, [seller_sales(row) for row in seller_totals(touched)], ['seller', 'day'])
+    return len(rows)
+
+
+@transaction.atomic
+def rebuild_sales_rollups():
+    """
+    Recomputes every rollup from the Payment table with one GROUP BY.
+    Returns the number of product rollups.
+    """
+    ProductDailySales.objects.all().delete()
+    SellerDailySales.objects.all().delete()
+    written, batch = 0, []
+    for row in payment_totals(Payment.objects.all()).iterator(chunk_size=2000):
+        batch.append(product_sales(row))
+        if len(batch) == 1000:
+            ProductDailySales.objects.bulk_create(batch)
+            written, batch = written + len(batch), []
+    ProductDailySales.objects.bulk_create(batch)
+    SellerDailySales.objects.bulk_create(
+        [seller_sales(row) for row in seller_totals(ProductDailySales.objects.all()).iterator(chunk_size=2000)],
+        batch_size=1000,
+    )
+    return written + len(batch)
+
+
+def date_range(date_from=None, date_to=None):
+    """
+    The inclusive ``(start, end)`` a dashboard covers: the last
+    ANALYTICS_DEFAULT_DAYS days by default, at most ANALYTICS_MAX_DAYS.
+    """
+    end = date_to or timezone.localdate()
+    start = date_from or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ValueError('date_from must not be after date_to')
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise ValueError(f'At most {ANALYTICS_MAX_DAYS} days per request')
+    return start, end
+
+
+def sales_series(seller, start, end, product=None):
+    """
+    One ``{day, revenue, units, orders}`` per day from ``start`` to
+    ``end``, zero on days without sales, for the seller or one of their
+    products.
+    """
+    if product is None:
+        rollups = SellerDailySales.objects.filter(seller=seller)
+    else:
+        rollups = ProductDailySales.objects.filter(seller=seller, product=product)
+    found = {row['day']: row for row in rollups.filter(day__range=(start, end)).values('day', *METRICS)}
+    series = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        series.append(found.get(day) or {'day': day, 'revenue': 0, 'units': 0, 'orders': 0})
+    return series
+
+
+def top_products(seller, start, end, by='revenue', limit=10):
+    """The seller's ``limit`` best products between ``start`` and ``end``."""
+    if by not in METRICS:
+        raise ValueError(f'by must be one of {", ".join(METRICS)}')
+    rows = (
+        ProductDailySales.objects.filter(seller=seller, day__range=(start, end))
+        .values('product')
+        .annotate(name=F('product__name'), total_revenue=Sum('revenue'), total_units=Sum('units'), total_orders=Sum('orders'))
+        .order_by(f'-total_{by}', 'product_id')[:limit]
+    )
+    return [
+        {'product': row['product'], 'name': row['name'], 'revenue': row['total_revenue'], 'units': row['total_units'], 'orders': row['total_orders']}
+        for row in rows
+    ]
@@ -7,4 +7,8 @@ class EcomConfig(AppConfig):
 
     def ready(self) -> None:
         import ecom.signals
+        import ecom.tasks
+        from ecom.instrumentation import PERF_INSTRUMENTATION, install
+        if PERF_INSTRUMENTATION:
+            install()
         return super().ready()
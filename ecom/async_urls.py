@@ -0,0 +1,29 @@
+from django.urls import path, re_path
+
+from . import async_views, views
+
+
+# GET on the hot catalog and cart reads runs on the event loop; other
+# methods on the same URLs fall through to the DRF viewsets. Served ahead of
+# ecom.urls by the ASGI application only (see ecommerce/asgi_urls.py).
+urlpatterns = [
+    path('products/', async_views.read_view(
+        async_views.product_list, views.ProductViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
+    re_path(r'^products/(?P<pk>[^/.]+)/$', async_views.read_view(
+        async_views.product_detail,
+        views.ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
+    )),
+    path('categories/', async_views.read_view(
+        async_views.category_list, views.CategoryViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
+    path('subcategory/', async_views.read_view(
+        async_views.subcategory_list, views.SubCategoryViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
+    path('cart/', async_views.read_view(
+        async_views.cart_list, views.CartViewSet.as_view({'get': 'list', 'post': 'create'}),
+    )),
+    path('search/', async_views.read_view(async_views.search_products, views.SearchProducts.as_view())),
+    # Server-sent events need the event loop; ecom.urls answers 501.
+    path('nnotifications/stream/', views.notification_stream, name='notification_stream'),
+]
@@ -0,0 +1,141 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+
+from .authentication import authenticate
+from .caching import TAXONOMY, acached_response, body_etag, json_response, not_modified, product_cache, request_variant
+from .conditional import acatalog_validators, aconditional_response, alist_validators
+from .facets import bitmap, facet_index
+from .filters import ProductFacetFilter
+from .instrumentation import InstrumentedJSONRenderer
+from .models import Cart, Product
+from . import replicas
+from .pagination import KeysetPagination, ProductPagination, StandardPageNumberPagination
+from .replicas import ReplicaReadsMixin, choose_replica, reading_from
+from .search import get_search_backend
+from .serializers import CartSerializer, CategorySerializer, ProductRowSerializer, ProductSerializer, SubCategorySerializer
+from .views import CategoryViewSet, ProductViewSet, SearchProducts, SubCategoryViewSet
+
+
+def render(data, status=status.HTTP_200_OK):
+    # Same bytes as the DRF views' JSON responses.
+    return HttpResponse(InstrumentedJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def read_view(handler, fallback):
+    """
+    An async view that answers GET and HEAD with ``handler`` and hands every
+    other method to the synchronous DRF ``fallback`` view, so one URL keeps
+    serving the whole API. ``handler`` receives a DRF ``Request`` for its
+    query params and absolute URIs; API exceptions it raises are rendered
+    the way DRF's exception handler would.
+
+    Reads go to a replica when ``fallback`` is a ``ReplicaReadsMixin`` view,
+    picked the same way: after authentication, unless the user is pinned to
+    the primary by a recent write.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(fallback)(request, *args, **kwargs)
+        replica = None
+        if replicas.REPLICAS and issubclass(fallback.cls, ReplicaReadsMixin):
+            replica = await sync_to_async(choose_replica)(await authenticate(request))
+        token = reading_from.set(replica)
+        try:
+            return await handler(Request(request), *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(data, exc.status_code)
+        finally:
+            reading_from.reset(token)
+    # DRF views are CSRF exempt and check it themselves for session users.
+    view.csrf_exempt = True
+    return view
+
+
+async def paginated(request, queryset, serializer_class, pagination_class=KeysetPagination):
+    paginator = pagination_class()
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data).data
+
+
+async def product_list(request):
+    return await aconditional_response(request, await acatalog_validators(), list_products)
+
+
+async def list_products(request):
+    queryset = ProductFacetFilter().filter_queryset(request, ProductViewSet.queryset.all(), None)
+    paginator = ProductPagination()
+    rows = await paginator.apaginate_queryset(ProductRowSerializer.values(queryset), request)
+    serializer = await ProductRowSerializer.afor_rows(rows, {'request': request})
+    data = paginator.get_paginated_response(serializer.data).data
+    data['facets'] = await sync_to_async(facet_index.counts)(ProductFacetFilter.get_selection(request))
+    return render(data)
+
+
+async def product_detail(request, pk):
+    if not pk.isdigit():
+        raise NotFound('No Product matches the given query.')
+    variant = request_variant(request)
+    _, body = product_cache.peek(int(pk), variant) or (None, None)
+    if body is None:
+        def render_product():
+            try:
+                product = ProductViewSet.queryset.get(pk=pk)
+            except Product.DoesNotExist:
+                raise NotFound('No Product matches the given query.')
+            return InstrumentedJSONRenderer().render(ProductSerializer(product, context={'request': request}).data)
+        # Misses join the same single-flight as the sync view, in a thread.
+        _, body = await sync_to_async(product_cache.get)(int(pk), variant, render_product)
+    tag = body_etag(body)
+    if not_modified(request, tag):
+        return HttpResponseNotModified(headers={'ETag': tag})
+    return json_response(body, tag)
+
+
+async def category_list(request):
+    async def read(request):
+        return render(await paginated(request, CategoryViewSet.queryset.all(), CategorySerializer))
+    return await acached_response(TAXONOMY, read, request)
+
+
+async def subcategory_list(request):
+    async def read(request):
+        return render(await paginated(request, SubCategoryViewSet.queryset.all(), SubCategorySerializer))
+    return await acached_response(TAXONOMY, read, request)
+
+
+async def search_products(request):
+    query = request.query_params.get(SearchProducts.search_param, '').strip()
+    if not query:
+        return await list_products(request)
+
+    selection = ProductFacetFilter.get_selection(request)
+    hits = await sync_to_async(get_search_backend().search)(query)
+    ranked = hits
+    if selection:
+        queryset = ProductFacetFilter().filter_queryset(request, Product.objects.filter(pk__in=hits), None)
+        matching = {pk async for pk in queryset.values_list('pk', flat=True)}
+        ranked = [pk for pk in hits if pk in matching]
+
+    paginator = StandardPageNumberPagination()
+    ids = paginator.paginate_queryset(ranked, request)
+    products = await ProductViewSet.queryset.ain_bulk(ids)
+    serializer = ProductSerializer([products[pk] for pk in ids if pk in products], many=True, context={'request': request})
+    data = paginator.get_paginated_response(serializer.data).data
+    data['facets'] = await sync_to_async(facet_index.counts)(selection, within=bitmap(hits))
+    return render(data)
+
+
+async def cart_list(request):
+    user = await authenticate(request)
+    if user is None:
+        return render({'detail': 'Authentication credentials were not provided.'}, status.HTTP_401_UNAUTHORIZED)
+    lines = Cart.objects.filter(user=user)
+
+    async def read(request):
+        return render(await paginated(request, lines, CartSerializer))
+    return await aconditional_response(request, await alist_validators(lines), read, user)
@@ -0,0 +1,30 @@
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+@sync_to_async
+def jwt_user(request):
+    authentication = JWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+        if result is None and request.GET.get('token'):
+            # EventSource cannot send headers, so browsers pass the access
+            # token in the query string.
+            token = authentication.get_validated_token(request.GET['token'])
+            result = authentication.get_user(token), token
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def authenticate(request):
+    """
+    The user of a plain Django async view, authenticated the way the DRF
+    views are: a simplejwt access token first, then the session. Returns
+    ``None`` for anonymous requests.
+    """
+    user = await jwt_user(request)
+    if user is None:
+        user = await request.auser()
+    return user if user.is_authenticated else None
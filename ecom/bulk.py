@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .importers import ProductCSVImporter
+from .models import Product
+from .serializers import ProductBulkUpdateSerializer
+from .signals import products_changed
+from .tasks import enqueue_discount_notifications
+
+
+PRODUCT_BULK_LIMIT = getattr(settings, 'PRODUCT_BULK_LIMIT', 5000)
+
+NOT_FOUND = {'id': ['Not found.']}
+
+
+def create_products(user, items):
+    """
+    Creates ``user``'s products from a list of ProductSerializer-style
+    dicts with the CSV importer's batched inserts, all in one transaction.
+    Returns one result per item, in order: ``{'index', 'id'}`` or
+    ``{'index', 'errors'}``.
+    """
+    importer = ProductCSVImporter()
+    rows = [(index, {**item, 'user': user.pk}) for index, item in enumerate(items)]
+    created = importer.import_chunk(rows)
+    results = [{'index': index, 'id': product.pk} for index, product in created]
+    results += [{'index': error['line'], 'errors': error['errors']} for error in importer.errors]
+    return sorted(results, key=lambda result: result['index'])
+
+
+@transaction.atomic
+def update_products(user, items):
+    """
+    Applies partial updates of ``price``, ``discount``, ``quantity`` and
+    ``status`` to ``user``'s products with one ``bulk_update`` per batch.
+    Returns one result per item, in order: ``{'index', 'id'}`` or
+    ``{'index', 'errors'}``.
+    """
+    results, changes = [], {}
+    for index, item in enumerate(items):
+        serializer = ProductBulkUpdateSerializer(data=item)
+        if not serializer.is_valid():
+            results.append({'index': index, 'errors': serializer.errors})
+            continue
+        data = dict(serializer.validated_data)
+        pk = data.pop('id')
+        if pk in changes:
+            results.append({'index': index, 'errors': {'id': ['Duplicate product.']}})
+            continue
+        changes[pk] = (index, data)
+
+    fields = sorted({field for _, data in changes.values() for field in data})
+    products = Product.objects.filter(user=user, pk__in=list(changes)).only('pk', 'discount', *fields).in_bulk()
+    updated, discounted = [], []
+    now = timezone.now()
+    for pk, (index, data) in changes.items():
+        product = products.get(pk)
+        if product is None:
+            results.append({'index': index, 'errors': NOT_FOUND})
+            continue
+        old_discount = product.discount or 0
+        for field, value in data.items():
+            setattr(product, field, value)
+        product.modified = now
+        if product.discount is not None and product.discount > old_discount:
+            discounted.append((product.pk, old_discount, product.discount))
+        updated.append(product)
+        results.append({'index': index, 'id': pk})
+
+    if updated:
+        Product.objects.bulk_update(updated, fields + ['modified'], batch_size=1000)
+        # bulk_update sends no post_save: reindex, and queue the wishlist
+        # notifications the discount receiver would have.
+        products_changed.send(sender=Product, ids=[product.pk for product in updated])
+        for pk, old_discount, new_discount in discounted:
+            enqueue_discount_notifications(pk, old_discount, new_discount)
+    return sorted(results, key=lambda result: result['index'])
+
+
+@transaction.atomic
+def delete_products(user, ids):
+    """
+    Deletes ``user``'s products among ``ids``; related rows go with one
+    DELETE ... IN per table. Returns one result per id.
+    """
+    owned = set(Product.objects.filter(user=user, pk__in=ids).values_list('pk', flat=True))
+    Product.objects.filter(pk__in=owned).delete()
+    return [{'id': pk} if pk in owned else {'id': pk, 'errors': NOT_FOUND} for pk in ids]
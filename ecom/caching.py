@@ -0,0 +1,316 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .replicas import primary_reads
+
+
+# With the per-process local-memory backend a version change only reaches
+# the process that made it, so entries must also expire on their own.
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+TAXONOMY = 'taxonomy'
+
+PRODUCT_CACHE_SIZE = getattr(settings, 'PRODUCT_CACHE_SIZE', 1000)
+PRODUCT_CACHE_TTL = getattr(settings, 'PRODUCT_CACHE_TTL', 30)
+# Per-product versions kept in process without a shared tier; past this
+# many they are folded into one generation bump.
+PRODUCT_CACHE_VERSIONS = getattr(settings, 'PRODUCT_CACHE_VERSIONS', 10000)
+# Alias of a cache in CACHES shared by all processes, or None for in-process
+# caching only.
+PRODUCT_CACHE_SHARED = getattr(settings, 'PRODUCT_CACHE_SHARED', None)
+
+
+def version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    version = cache.get(version_key(namespace))
+    if version is None:
+        # add() so processes sharing the cache agree on one version.
+        cache.add(version_key(namespace), uuid.uuid4().hex, None)
+        version = cache.get(version_key(namespace))
+    return version
+
+
+async def aget_version(namespace):
+    version = await cache.aget(version_key(namespace))
+    if version is None:
+        await cache.aadd(version_key(namespace), uuid.uuid4().hex, None)
+        version = await cache.aget(version_key(namespace))
+    return version
+
+
+def bump_version(namespace):
+    """
+    Retires every cached response of ``namespace`` once the current
+    transaction commits. Versions are random rather than counters, so an
+    evicted version key can never bring old entries back.
+    """
+    transaction.on_commit(lambda: cache.set(version_key(namespace), uuid.uuid4().hex, None))
+
+
+def request_variant(request):
+    return hashlib.md5(f'{request.get_host()}{request.get_full_path()}{request.headers.get("Accept", "")}'.encode()).hexdigest()
+
+
+def response_key(namespace, version, request):
+    # The host is part of the key because bodies carry absolute links, and
+    # Accept because it picks the renderer.
+    return f'{namespace}:{version}:{request_variant(request)}'
+
+
+def body_etag(body):
+    # Versions in a per-process cache change only in the process that wrote;
+    # a hash of the body is right whichever process rendered it.
+    return f'"{hashlib.md5(body).hexdigest()[:20]}"'
+
+
+def not_modified(request, tag):
+    return tag in [value.strip() for value in request.headers.get('If-None-Match', '').split(',')]
+
+
+def json_response(body, tag):
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = tag
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache for the JSON ``list`` and ``retrieve`` responses of
+    a viewset whose data changes rarely. Bodies are cached as rendered bytes
+    under the namespace version and the ETag is a hash of the body, so
+    ``If-None-Match`` is answered with a 304 from one cache read. Set
+    ``cache_namespace`` and bump it when the data changes. Misses are
+    rendered from the primary database.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return view(request, *args, **kwargs)
+        key = response_key(self.cache_namespace, get_version(self.cache_namespace), request)
+        body = cache.get(key)
+        if body is None:
+            with primary_reads():
+                response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = request.accepted_renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+            cache.set(key, body, RESPONSE_CACHE_TIMEOUT)
+        tag = body_etag(body)
+        if not_modified(request, tag):
+            return HttpResponseNotModified(headers={'ETag': tag})
+        return json_response(body, tag)
+
+
+async def acached_response(namespace, read, request):
+    """
+    ``CachedResponseMixin`` for the async views: ``read`` is awaited with
+    ``request`` on a miss, against the primary, and its JSON body is shared
+    with the sync views.
+    """
+    key = response_key(namespace, await aget_version(namespace), request)
+    body = await cache.aget(key)
+    if body is None:
+        with primary_reads():
+            response = await read(request)
+        if response.status_code != 200:
+            return response
+        body = response.content
+        await cache.aset(key, body, RESPONSE_CACHE_TIMEOUT)
+    tag = body_etag(body)
+    if not_modified(request, tag):
+        return HttpResponseNotModified(headers={'ETag': tag})
+    return json_response(body, tag)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache holding at most ``maxsize`` entries, each
+    for at most ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller
+    runs the function and the others wait for its result. A caller that
+    waits longer than ``timeout`` runs the function itself.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event()}
+        if not leader:
+            if call['done'].wait(self.timeout) and 'result' in call:
+                return call['result']
+            return func()
+        try:
+            call['result'] = func()
+            return call['result']
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+
+class ProductResponseCache:
+    """
+    Rendered product detail bodies keyed by product id and version.
+
+    Entries live in a bounded in-process LRU and, when ``shared`` names a
+    cache alias, also in that cache, which then holds the versions too, so
+    an invalidation reaches every process. Without it versions are local to
+    the process and other processes catch up when their entries expire after
+    ``ttl`` seconds; responses take their ETag from the body for the same
+    reason. Misses are recomputed once per process however many requests
+    are waiting on them.
+    """
+
+    def __init__(self, maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL, shared=PRODUCT_CACHE_SHARED, max_versions=PRODUCT_CACHE_VERSIONS):
+        self.local = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.max_versions = max_versions
+        self.shared_alias = shared
+        self.flights = SingleFlight()
+        self.versions = {}
+        self.generation = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def version(self, pk):
+        if self.shared is None:
+            return f'{self.generation}.{self.versions.get(pk, 0)}'
+        keys = ['product:generation', f'product:{pk}:version']
+        versions = self.shared.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.shared.add(key, uuid.uuid4().hex, None)
+                versions[key] = self.shared.get(key)
+        return f'{versions[keys[0]]}.{versions[keys[1]]}'
+
+    def key(self, pk, variant):
+        return f'product:{pk}:{self.version(pk)}:{variant}'
+
+    def peek(self, pk, variant):
+        """
+        ``(key, body)`` when that needs no I/O, i.e. without a shared tier,
+        else ``None``; ``body`` is ``None`` on a local miss.
+        """
+        if self.shared is not None:
+            return None
+        key = self.key(pk, variant)
+        return key, self.local.get(key)
+
+    def get(self, pk, variant, compute):
+        """
+        ``(key, body)`` for product ``pk``; ``compute()`` renders the body
+        on a miss and may return ``None`` for responses not to cache.
+        """
+        key = self.key(pk, variant)
+        body = self.local.get(key)
+        if body is None:
+            body = self.flights.do(key, lambda: self.load(key, compute))
+        return key, body
+
+    def load(self, key, compute):
+        shared = self.shared
+        body = shared.get(key) if shared is not None else None
+        if body is None:
+            with primary_reads():
+                body = compute()
+            if body is None:
+                return None
+            if shared is not None:
+                shared.set(key, body, self.ttl)
+        self.local.set(key, body)
+        return body
+
+    def expire(self, ids):
+        shared = self.shared
+        for pk in ids:
+            if shared is None:
+                self.versions[pk] = self.versions.get(pk, 0) + 1
+            else:
+                shared.set(f'product:{pk}:version', uuid.uuid4().hex, None)
+        if len(self.versions) > self.max_versions:
+            # Dropping one product's counter would bring its old entries
+            # back; a new generation retires every entry instead.
+            self.local.clear()
+            self.versions.clear()
+            self.generation += 1
+
+    def expire_all(self):
+        self.local.clear()
+        self.versions.clear()
+        self.generation += 1
+        if self.shared is not None:
+            self.shared.set('product:generation', uuid.uuid4().hex, None)
+
+
+product_cache = ProductResponseCache()
+
+
+def expire_products(ids):
+    ids = list(ids)
+    transaction.on_commit(lambda: product_cache.expire(ids))
+
+
+def expire_all_products():
+    transaction.on_commit(product_cache.expire_all)
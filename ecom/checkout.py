@@ -0,0 +1,72 @@
+from django.db import connection, transaction
+
+from .models import Cart, Payment, PaymentMethod, Profile, StockReservation
+from .stock import sell_many
+from .tasks import enqueue_fulfilment
+
+
+class CheckoutError(Exception):
+    pass
+
+
+@transaction.atomic
+def checkout(user, method='visa'):
+    """
+    Settles every line of ``user``'s cart in one transaction with a fixed
+    number of statements whatever the cart size: stock is taken by
+    ``sell_many``, payments are bulk inserted, shipments and notifications
+    are queued as one batch of jobs and the cart is cleared with one
+    DELETE. Returns the created payments.
+    """
+    # Locked, so a second checkout of the same cart waits for this one and
+    # then finds it empty.
+    lines = list(Cart.objects.filter(user=user).select_related('product', 'attribute').select_for_update(of=('self',)))
+    if not lines:
+        raise CheckoutError('Your cart is empty.')
+    try:
+        payment_method = PaymentMethod.objects.get(name=method)
+    except PaymentMethod.DoesNotExist:
+        raise CheckoutError(f'Unknown payment method {method}.')
+    if not Profile.objects.filter(user=user).exists():
+        raise CheckoutError('Add a shipping address to your profile first.')
+
+    units = [line.quantity or 1 for line in lines]
+    for line, n in zip(lines, units):
+        if n < 0:
+            raise CheckoutError(f'{line.product.name} has a negative quantity in your cart.')
+        if line.attribute is not None and line.attribute.product_id != line.product_id:
+            raise CheckoutError(f'The chosen option does not belong to {line.product.name}.')
+    reservations = sell_many(user, [(line.product_id, line.attribute_id, n) for line, n in zip(lines, units)])
+
+    payments = [
+        Payment(
+            user=user,
+            product=line.product,
+            unit_price=line.product.price,
+            amount=line.product.price * n,
+            method=payment_method,
+        )
+        for line, n in zip(lines, units)
+    ]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Payment.objects.bulk_create(payments)
+        enqueue_fulfilment([payment.pk for payment in payments])
+    else:
+        # Without RETURNING the payment ids are unknown, so save row by row
+        # and let the Payment post_save receiver queue the fulfilment.
+        for payment in payments:
+            payment.save()
+
+    sold = []
+    for payment, reservation in zip(payments, reservations):
+        if reservation is not None:
+            reservation.payment = payment
+            sold.append(reservation)
+    StockReservation.objects.bulk_update(sold, ['payment'])
+
+    # Backends without row locks (SQLite serializes writers instead): the
+    # lines must still be there to be paid for.
+    deleted, _ = Cart.objects.filter(pk__in=[line.pk for line in lines]).delete()
+    if deleted != len(lines):
+        raise CheckoutError('Your cart changed during checkout, please try again.')
+    return payments
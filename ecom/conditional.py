@@ -0,0 +1,109 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from .models import CatalogChange, Product
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for ``list`` and ``retrieve``, computed
+    with one aggregate query over ``modified_field`` and answered with a 304
+    before anything is serialized.
+
+    A list's validators are the newest ``modified`` plus the row count (so
+    deletions change them too) of ``get_conditional_queryset()``, the
+    filtered queryset by default. Views whose representation depends on
+    more than the listed rows widen it, and views over large tables
+    override ``list_validators``, as with ``catalog_validators``.
+    """
+    modified_field = 'modified'
+
+    def get_conditional_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def list_validators(self):
+        state = self.get_conditional_queryset().aggregate(last=Max(self.modified_field), count=Count('pk'))
+        return state['last'], state['count']
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *self.list_validators(), *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            last = self.filter_queryset(self.get_queryset()).filter(**lookup).values_list(self.modified_field, flat=True).first()
+        except (TypeError, ValueError):
+            last = None
+        return self.conditional_response(request, super().retrieve, last, 1, *args, **kwargs)
+
+    def conditional_response(self, request, view, last, count, *args, **kwargs):
+        if last is None:
+            # Empty or missing: nothing to validate against.
+            return view(request, *args, **kwargs)
+        etag, last_modified = validators_for(request, last, count, request.user, request.accepted_media_type)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        return with_validators(response, etag, last_modified)
+
+
+def validators_for(request, last, count, user, media_type):
+    # The path covers filters and pages, the user per-user querysets.
+    variant = f'{last.isoformat()}:{count}:{getattr(user, "pk", None)}:{request.get_full_path()}:{media_type}'
+    return quote_etag(hashlib.md5(variant.encode()).hexdigest()), int(last.timestamp())
+
+
+def with_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def latest(*times):
+    return max((time for time in times if time is not None), default=None)
+
+
+def catalog_validators():
+    """
+    The product list's validators from two index lookups rather than a
+    count over the catalog: the newest ``modified`` and the last delete.
+    """
+    last = Product.objects.aggregate(last=Max('modified'))['last']
+    deleted = CatalogChange.objects.filter(name='products').values_list('deleted', flat=True).first()
+    return latest(last, deleted), None
+
+
+async def acatalog_validators():
+    last = (await Product.objects.aaggregate(last=Max('modified')))['last']
+    deleted = await CatalogChange.objects.filter(name='products').values_list('deleted', flat=True).afirst()
+    return latest(last, deleted), None
+
+
+def products_deleted():
+    CatalogChange.objects.update_or_create(name='products', defaults={'deleted': timezone.now()})
+
+
+async def alist_validators(queryset, modified_field='modified'):
+    state = await queryset.aaggregate(last=Max(modified_field), count=Count('pk'))
+    return state['last'], state['count']
+
+
+async def aconditional_response(request, validators, view, user=None):
+    """
+    ``ConditionalGetMixin.list`` for the async views: ``validators`` as
+    ``list_validators`` returns them, then a 304 or ``await view(request)``.
+    They render JSON only.
+    """
+    last, count = validators
+    if last is None:
+        return await view(request)
+    etag, last_modified = validators_for(request, last, count, user, 'application/json')
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await view(request)
+    return with_validators(response, etag, last_modified)
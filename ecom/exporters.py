@@ -0,0 +1,70 @@
+import csv
+import zlib
+
+from django.conf import settings
+
+from .models import Product
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'PRODUCT_EXPORT_CHUNK_SIZE', 2000)
+
+EXPORT_HEADER = ['User Name', 'Product name', 'subcategory', 'price', 'status', 'quantity']
+EXPORT_COLUMNS = ['user__username', 'name', 'subcategory__name', 'price', 'status', 'quantity']
+
+
+class Echo:
+    # csv.writer only needs something with write(); hand the line back
+    # instead of buffering it so the caller can yield it.
+    def write(self, value):
+        return value
+
+
+class ProductCSVExporter:
+    """
+    Yields the product catalog as CSV text without materializing it.
+
+    Rows are read as joined tuples through a server-side cursor
+    (``iterator(chunk_size=...)``) and emitted in batches of one chunk, so
+    memory stays flat regardless of the catalog size.
+    """
+
+    def __init__(self, queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+        self.queryset = Product.objects.all() if queryset is None else queryset
+        self.chunk_size = chunk_size
+
+    def filter(self, seller=None, subcategory=None, date_from=None, date_to=None):
+        queryset = self.queryset
+        if seller is not None:
+            queryset = queryset.filter(user_id=seller)
+        if subcategory is not None:
+            queryset = queryset.filter(subcategory_id=subcategory)
+        if date_from is not None:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to is not None:
+            queryset = queryset.filter(date__lte=date_to)
+        self.queryset = queryset
+        return self
+
+    def rows(self):
+        return self.queryset.order_by('pk').values_list(*EXPORT_COLUMNS).iterator(chunk_size=self.chunk_size)
+
+    def stream(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_HEADER)
+        batch = []
+        for row in self.rows():
+            batch.append(writer.writerow(row))
+            if len(batch) >= self.chunk_size:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    def stream_gzip(self, level=6):
+        # wbits=31 makes zlib write a gzip header and trailer.
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in self.stream():
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
@@ -0,0 +1,245 @@
+import threading
+import time
+from collections import defaultdict
+from functools import reduce
+from datetime import timedelta
+from operator import and_, or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Product, ProductAtribute
+from .replicas import primary_reads
+
+
+PRICE_BANDS = getattr(settings, 'PRODUCT_PRICE_BANDS', [0, 25, 50, 100, 250, 500])
+DISCOUNT_BANDS = getattr(settings, 'PRODUCT_DISCOUNT_BANDS', [1, 10, 25, 50])
+
+# How often a process re-reads the products other processes changed.
+FACET_INDEX_SYNC_SECONDS = getattr(settings, 'FACET_INDEX_SYNC_SECONDS', 30)
+
+FACETS = ('category', 'subcategory', 'gender', 'price', 'discount', 'attribute')
+
+
+def band(value, edges):
+    # Label of the [low, high) band holding value, e.g. '25-50' or '500+'.
+    if value is None or value < edges[0]:
+        return None
+    for low, high in zip(edges, edges[1:]):
+        if value < high:
+            return f'{low}-{high}'
+    return f'{edges[-1]}+'
+
+
+def band_range(label, edges):
+    low, _, high = label.partition('-')
+    low = float(low.rstrip('+'))
+    if low not in edges:
+        raise ValueError(label)
+    return low, float(high) if high else None
+
+
+def product_facets(ids=None):
+    """
+    Yields ``(product id, [(facet, value), ...])`` for the catalog, or for
+    ``ids`` only.
+    """
+    products = Product.objects.all()
+    attributes = ProductAtribute.objects.all()
+    if ids is not None:
+        products = products.filter(pk__in=ids)
+        attributes = attributes.filter(product_id__in=ids)
+
+    pairs = defaultdict(list)
+    for product_id, name, value in attributes.values_list('product_id', 'name', 'value').iterator(chunk_size=5000):
+        pairs[product_id].append(('attribute', f'{name}:{value}'))
+
+    columns = ('pk', 'subcategory__category__name', 'subcategory_id', 'subcategory__gender', 'price', 'discount')
+    for pk, category, subcategory, gender, price, discount in products.values_list(*columns).iterator(chunk_size=5000):
+        values = [
+            ('category', category),
+            ('subcategory', str(subcategory)),
+            ('gender', gender),
+            ('price', band(price, PRICE_BANDS)),
+            ('discount', band(discount, DISCOUNT_BANDS) or 'none'),
+        ]
+        yield pk, [item for item in values if item[1] is not None] + pairs.pop(pk, [])
+
+
+def facet_filter(selected):
+    """
+    ORM version of the facet selection: values of one facet are OR'ed,
+    facets are AND'ed.
+    """
+    conditions = []
+    if selected.get('category'):
+        conditions.append(Q(subcategory__category__name__in=selected['category']))
+    if selected.get('subcategory'):
+        conditions.append(Q(subcategory_id__in=selected['subcategory']))
+    if selected.get('gender'):
+        conditions.append(Q(subcategory__gender__in=selected['gender']))
+    if selected.get('price'):
+        conditions.append(reduce(or_, [range_filter('price', band_range(label, PRICE_BANDS)) for label in selected['price']]))
+    if selected.get('discount'):
+        discount = [
+            Q(discount=0) | Q(discount__isnull=True) if label == 'none' else range_filter('discount', band_range(label, DISCOUNT_BANDS))
+            for label in selected['discount']
+        ]
+        conditions.append(reduce(or_, discount))
+    if selected.get('attribute'):
+        pairs = [Q(name=name, value=value) for name, _, value in (item.partition(':') for item in selected['attribute'])]
+        conditions.append(Q(pk__in=ProductAtribute.objects.filter(reduce(or_, pairs)).values('product_id')))
+    return reduce(and_, conditions, Q())
+
+
+def range_filter(field, bounds):
+    low, high = bounds
+    condition = Q(**{f'{field}__gte': low})
+    if high is not None:
+        condition &= Q(**{f'{field}__lt': high})
+    return condition
+
+
+def bitmap(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        bits[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class FacetIndex:
+    """
+    One bitmap per facet value, bit n set when product n has that value.
+
+    Counts for a selection are popcounts of bitmap intersections, so no
+    GROUP BY runs over the catalog. Each facet is counted against the
+    selection of the *other* facets, so sibling values stay selectable.
+    The index is built on first use and kept current by signals in the
+    process that made the write. Other processes catch up within
+    ``sync_interval`` seconds: products whose ``modified`` moved are
+    re-indexed, and a product count that no longer matches (a delete
+    elsewhere) rebuilds the index.
+    """
+
+    def __init__(self, sync_interval=FACET_INDEX_SYNC_SECONDS):
+        self.lock = threading.RLock()
+        self.sync_interval = sync_interval
+        self.built = False
+        self.bitmaps = {facet: {} for facet in FACETS}
+        self.universe = 0
+        self.values = {}
+        self.synced_at = None
+        self.next_sync = 0
+
+    def rebuild(self):
+        with self.lock:
+            started = timezone.now()
+            bits = defaultdict(bytearray)
+            values = {}
+            # Built on first use, maybe by a request reading from a replica,
+            # and then kept current from the primary's writes.
+            with primary_reads():
+                for pk, pairs in product_facets():
+                    values[pk] = pairs
+                    for pair in pairs + [(None, None)]:
+                        array = bits[pair]
+                        if len(array) <= pk >> 3:
+                            array.extend(bytes((pk >> 3) + 1 - len(array) + 1024))
+                        array[pk >> 3] |= 1 << (pk & 7)
+
+            self.bitmaps = {facet: {} for facet in FACETS}
+            for (facet, value), array in bits.items():
+                if facet is not None:
+                    self.bitmaps[facet][value] = int.from_bytes(array, 'little')
+            self.universe = int.from_bytes(bits[(None, None)], 'little')
+            self.values = values
+            self.built = True
+            self.synced(started)
+
+    def synced(self, started):
+        self.synced_at = started
+        self.next_sync = time.monotonic() + self.sync_interval
+
+    def sync(self):
+        with self.lock:
+            if time.monotonic() < self.next_sync:
+                return
+            started = timezone.now()
+            # Overlapping the previous check catches rows committed late.
+            since = self.synced_at - timedelta(seconds=self.sync_interval)
+            with primary_reads():
+                changed = list(Product.objects.filter(modified__gte=since).values_list('pk', flat=True))
+                count = Product.objects.count()
+                self.index_products(changed)
+            if count != len(self.values):
+                self.rebuild()
+            else:
+                self.synced(started)
+
+    def index_products(self, ids):
+        with self.lock:
+            if not self.built:
+                return
+            ids = set(ids)
+            self.discard(ids)
+            for pk, pairs in product_facets(ids):
+                self.values[pk] = pairs
+                self.universe |= 1 << pk
+                for facet, value in pairs:
+                    self.bitmaps[facet][value] = self.bitmaps[facet].get(value, 0) | 1 << pk
+
+    def remove_products(self, ids):
+        with self.lock:
+            if self.built:
+                self.discard(ids)
+
+    def discard(self, ids):
+        for pk in ids:
+            self.universe &= ~(1 << pk)
+            for facet, value in self.values.pop(pk, ()):
+                remaining = self.bitmaps[facet][value] & ~(1 << pk)
+                if remaining:
+                    self.bitmaps[facet][value] = remaining
+                else:
+                    del self.bitmaps[facet][value]
+
+    def counts(self, selected, within=None):
+        with self.lock:
+            if not self.built:
+                self.rebuild()
+            else:
+                self.sync()
+            base = self.universe if within is None else self.universe & within
+            masks = {
+                facet: reduce(or_, (self.bitmaps[facet].get(value, 0) for value in selected[facet]), 0)
+                for facet in FACETS if selected.get(facet)
+            }
+            counts = {}
+            for facet in FACETS:
+                scope = reduce(and_, (mask for other, mask in masks.items() if other != facet), base)
+                counts[facet] = {
+                    value: count
+                    for value, bits in sorted(self.bitmaps[facet].items())
+                    if (count := (bits & scope).bit_count())
+                }
+            return counts
+
+
+facet_index = FacetIndex()
+
+
+def index_products(ids):
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: facet_index.index_products(ids))
+
+
+def remove_products(ids):
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: facet_index.remove_products(ids))
@@ -0,0 +1,45 @@
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from swapper import load_model
+
+from .pubsub import notification_event, publish_on_commit
+from .unread import notified
+
+
+def notification(recipient_id, actor, verb, description, timestamp=None):
+    """
+    Unsaved django-notifications-hq ``Notification``, filled in the way
+    ``notify.send`` would, so many of them can go out in one INSERT.
+    """
+    Notification = load_model('notifications', 'Notification')
+    return Notification(
+        recipient_id=recipient_id,
+        actor_content_type=ContentType.objects.get_for_model(actor),
+        actor_object_id=actor.pk,
+        verb=verb,
+        description=description,
+        public=True,
+        timestamp=timestamp or timezone.now(),
+        level=Notification.LEVELS.info,
+    )
+
+
+def payment_notifications(payment):
+    product = payment.product
+    return [
+        notification(product.user_id, payment, 'you reached level 10', f'customer have successfully paid for {product.name}.'),
+        notification(payment.user_id, payment, 'you reached level 10', f'You have successfully paid for {product.name}.'),
+    ]
+
+
+def bulk_notify(notifications, batch_size=1000):
+    Notification = load_model('notifications', 'Notification')
+    created = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    # bulk_create sends no post_save, so move the badges here.
+    notified(notification.recipient_id for notification in created)
+    # Without RETURNING the ids are unknown; streams pick those rows up on
+    # their next resync instead.
+    for notification in created:
+        if notification.pk is not None:
+            publish_on_commit(notification.recipient_id, notification_event(notification))
+    return created
@@ -0,0 +1,25 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .facets import FACETS, facet_filter
+
+
+class ProductFacetFilter(BaseFilterBackend):
+    """
+    Filters products by facet query parameters, e.g.
+    ``?category=clothes&gender=male&gender=unisex&price=25-50&attribute=size:XL``.
+    Repeating a parameter selects any of its values.
+    """
+
+    @staticmethod
+    def get_selection(request):
+        return {facet: request.query_params.getlist(facet) for facet in FACETS if request.query_params.getlist(facet)}
+
+    def filter_queryset(self, request, queryset, view):
+        selected = self.get_selection(request)
+        if not selected:
+            return queryset
+        try:
+            return queryset.filter(facet_filter(selected))
+        except ValueError:
+            raise ValidationError({'detail': 'Invalid facet value.'})
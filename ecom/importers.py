@@ -0,0 +1,122 @@
+import codecs
+import csv
+from collections import defaultdict, deque
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Product, ProductAtribute, SubCategory
+from .signals import products_changed
+from .serializers import ProductImportSerializer
+
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 1000)
+
+
+class ProductCSVImporter:
+    """
+    Streams a product CSV into the catalog in fixed size chunks.
+
+    The upload is decoded line by line, every chunk is validated and written
+    with two ``bulk_create`` calls (products, then their attributes) inside
+    its own transaction, so memory and transaction size are bounded by the
+    chunk size rather than by the file. Bad rows are collected and reported
+    instead of aborting the import.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.errors = []
+
+    def run(self, file_obj):
+        reader = csv.DictReader(codecs.iterdecode(file_obj, 'utf-8-sig'))
+        rows = ((reader.line_num, row) for row in reader)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        self.errors.sort(key=lambda error: error['line'])
+        return {'created': self.created, 'failed': len(self.errors), 'errors': self.errors}
+
+    def import_chunk(self, chunk):
+        """
+        Validates and inserts ``(line, row)`` pairs in one transaction.
+        Returns the ``(line, product)`` pairs created.
+        """
+        valid = []
+        for line, row in chunk:
+            # Empty cells fall back to the field defaults instead of failing
+            # integer/float parsing; unnamed overflow columns are dropped.
+            data = {key: value for key, value in row.items() if key is not None and value not in ('', None)}
+            serializer = ProductImportSerializer(data=data)
+            if serializer.is_valid():
+                valid.append((line, serializer.validated_data))
+            else:
+                self.errors.append({'line': line, 'errors': serializer.errors})
+
+        valid = self.check_references(valid)
+        if not valid:
+            return []
+
+        with transaction.atomic():
+            products = [Product(**{k: v for k, v in data.items() if k != 'attribute'}) for _, data in valid]
+            insert_products(products)
+            ProductAtribute.objects.bulk_create([
+                ProductAtribute(product=product, **attribute)
+                for product, (_, data) in zip(products, valid)
+                for attribute in data['attribute']
+            ])
+            # bulk_create sends no post_save, so announce the chunk explicitly.
+            products_changed.send(sender=Product, ids=[product.pk for product in products])
+        self.created += len(products)
+        return [(line, product) for product, (line, _) in zip(products, valid)]
+
+    def check_references(self, valid):
+        user_ids = {data['user_id'] for _, data in valid}
+        subcategory_ids = {data['subcategory_id'] for _, data in valid}
+        known_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        known_subcategories = set(SubCategory.objects.filter(pk__in=subcategory_ids).values_list('pk', flat=True))
+
+        checked = []
+        for line, data in valid:
+            errors = {}
+            if data['user_id'] not in known_users:
+                errors['user'] = [f'Invalid pk "{data["user_id"]}" - object does not exist.']
+            if data['subcategory_id'] not in known_subcategories:
+                errors['subcategory'] = [f'Invalid pk "{data["subcategory_id"]}" - object does not exist.']
+            if errors:
+                self.errors.append({'line': line, 'errors': errors})
+            else:
+                checked.append((line, data))
+        return checked
+
+
+def insert_products(products):
+    """
+    Inserts ``products`` with one ``bulk_create`` and sets their ids. Without
+    RETURNING (MySQL) the new rows are read back by seller and name above
+    the highest id seen before the insert, rows sharing a seller and name
+    in insert order, which is the order one multi-row INSERT assigns ids.
+    Only a concurrent insert of the same seller and name, committed in
+    between, could be mistaken for one of them.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        Product.objects.bulk_create(products)
+        return
+    last = Product.objects.aggregate(last=Max('pk'))['last'] or 0
+    Product.objects.bulk_create(products)
+    inserted = defaultdict(deque)
+    rows = Product.objects.filter(
+        pk__gt=last,
+        user_id__in={product.user_id for product in products},
+        name__in={product.name for product in products},
+    ).order_by('pk').values_list('pk', 'user_id', 'name')
+    for pk, user_id, name in rows:
+        inserted[user_id, name].append(pk)
+    for product in products:
+        product.pk = inserted[product.user_id, product.name].popleft()
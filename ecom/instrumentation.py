@@ -0,0 +1,239 @@
+import functools
+import heapq
+import hmac
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+from rest_framework.renderers import JSONRenderer
+
+
+logger = logging.getLogger(__name__)
+
+PERF_INSTRUMENTATION = getattr(settings, 'PERF_INSTRUMENTATION', True)
+# Requests at least this slow are logged with their most expensive SQL.
+SLOW_REQUEST_SECONDS = getattr(settings, 'SLOW_REQUEST_SECONDS', 0.5)
+SLOW_REQUEST_TOP_SQL = getattr(settings, 'SLOW_REQUEST_TOP_SQL', 5)
+# Adds a Server-Timing header with the SQL and serialization figures, read
+# by the HTTP driver of ecom.loadtest. Off by default: it tells any client
+# how much work its request caused.
+SERVER_TIMING = getattr(settings, 'SERVER_TIMING', False)
+# Who may read /metrics besides staff users: scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>" and these client addresses.
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+# Routes are the URL names (``product-list``, ``cart-pay``...), so a label
+# value per view rather than per URL.
+LABELS = ['route', 'method']
+
+REQUEST_SECONDS = Histogram('ecom_request_seconds', 'Request latency.', LABELS + ['status'])
+REQUEST_QUERIES = Histogram(
+    'ecom_request_queries', 'SQL statements per request.', LABELS,
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, float('inf')),
+)
+REQUEST_SQL_SECONDS = Histogram('ecom_request_sql_seconds', 'Time spent in SQL per request.', LABELS)
+# Serializer .data plus rendering, less the SQL that ran lazily meanwhile;
+# its _sum over ecom_request_seconds_sum is the serialization share.
+REQUEST_SERIALIZE_SECONDS = Histogram('ecom_request_serialize_seconds', 'Time spent serializing and rendering per request.', LABELS)
+RESPONSE_BYTES = Histogram(
+    'ecom_response_bytes', 'Response body size, streaming responses excluded.', LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, float('inf')),
+)
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+        # Min-heap of the slowest statements as (seconds, order, sql).
+        self.statements = []
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        entry = (seconds, self.queries, sql)
+        if len(self.statements) < SLOW_REQUEST_TOP_SQL:
+            heapq.heappush(self.statements, entry)
+        else:
+            heapq.heappushpop(self.statements, entry)
+
+    def slowest(self):
+        return sorted(self.statements, reverse=True)
+
+
+current = ContextVar('ecom_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def add_execute_wrapper(connection, **kwargs):
+    # First in line, so execute_wrapper() blocks opened around the
+    # connection's creation still pop their own wrapper.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def timed_serialization(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = current.get()
+        if stats is None or stats.serializing:
+            return func(*args, **kwargs)
+        stats.serializing = True
+        started, sql_seconds = time.perf_counter(), stats.sql_seconds
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.serializing = False
+            stats.serialize_seconds += time.perf_counter() - started - (stats.sql_seconds - sql_seconds)
+    return wrapper
+
+
+class TimedSerializerMixin:
+    """
+    Counts a serializer's ``to_representation`` as serialization time, with
+    ``many=True`` too (the list calls it per item) and nested serializers
+    counted once.
+    """
+
+    @timed_serialization
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` whose rendering counts as serialization time."""
+
+    @timed_serialization
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def install():
+    """
+    Times every statement on every connection; only requests that went
+    through ``InstrumentationMiddleware`` are measured. Serialization is
+    timed by ``TimedSerializerMixin`` and ``InstrumentedJSONRenderer``.
+    """
+    connection_created.connect(add_execute_wrapper, dispatch_uid='ecom.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        add_execute_wrapper(connection)
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency, SQL statements and time, serialization time and
+    response size per route into the Prometheus histograms, and logs
+    requests slower than SLOW_REQUEST_SECONDS. Goes first in MIDDLEWARE
+    so the whole stack is timed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def observe(request, response, stats, seconds):
+    route = route_name(request)
+    labels = {'route': route, 'method': request.method}
+    REQUEST_SECONDS.labels(status=response.status_code, **labels).observe(seconds)
+    REQUEST_QUERIES.labels(**labels).observe(stats.queries)
+    REQUEST_SQL_SECONDS.labels(**labels).observe(stats.sql_seconds)
+    REQUEST_SERIALIZE_SECONDS.labels(**labels).observe(stats.serialize_seconds)
+    if not response.streaming:
+        RESPONSE_BYTES.labels(**labels).observe(len(response.content))
+    if SERVER_TIMING:
+        response['Server-Timing'] = (
+            f'sql;dur={stats.sql_seconds * 1000:.2f};desc="{stats.queries} queries", '
+            f'serialize;dur={stats.serialize_seconds * 1000:.2f}, total;dur={seconds * 1000:.2f}'
+        )
+
+    if seconds >= SLOW_REQUEST_SECONDS:
+        logger.warning(
+            'Slow request %s %s (%s): %.0f ms, %s queries in %.0f ms, serializing %.0f ms%s',
+            request.method, request.get_full_path(), route, seconds * 1000,
+            stats.queries, stats.sql_seconds * 1000, stats.serialize_seconds * 1000,
+            ''.join(f'\n  {took * 1000:.1f} ms  {sql}' for took, _, sql in stats.slowest()),
+        )
+
+
+def may_read_metrics(request):
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return True
+    if request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_IPS:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def metrics(request):
+    # Route names, volumes and timings are not for everyone.
+    if not may_read_metrics(request):
+        return HttpResponseForbidden()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # Gunicorn-style worker processes each write their own files.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
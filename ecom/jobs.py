@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+JOB_LOCK_TIMEOUT = getattr(settings, 'JOB_LOCK_TIMEOUT', timedelta(minutes=5))
+
+registry = {}
+
+
+def task(name=None):
+    """
+    Registers a job handler. Handlers receive the job payload as keyword
+    arguments and run in the same transaction that marks the job done, so
+    their database writes happen exactly once even if a worker dies.
+    """
+    def register(func):
+        registry[name or func.__name__] = func
+        return func
+    return register
+
+
+def idempotency_key(name, *parts):
+    key = f'{name}:' + ':'.join(str(part) for part in parts)
+    if len(key) > 100:
+        key = f'{name}:' + hashlib.sha1(key.encode()).hexdigest()
+    return key
+
+
+def enqueue(name, payload=None, key=None, delay=None, max_attempts=5):
+    """
+    Adds a job in the current transaction: workers only see it once the
+    surrounding work commits and never if it rolls back. Jobs sharing an
+    idempotency ``key`` are only queued once.
+    """
+    if name not in registry:
+        raise KeyError(f'Unknown job {name}')
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=key,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+    Job.objects.bulk_create([job], ignore_conflicts=key is not None)
+    return job
+
+
+def claim(batch_size=10, worker=None):
+    """
+    Marks up to ``batch_size`` ready jobs as running for this worker and
+    returns them. Jobs left running past JOB_LOCK_TIMEOUT by a dead worker
+    are put back first.
+    """
+    now = timezone.now()
+    Job.objects.filter(status='running', locked_at__lt=now - JOB_LOCK_TIMEOUT).update(status='queued', locked_by=None)
+
+    token = f'{worker or os.getpid()}:{uuid.uuid4().hex[:12]}'
+    with transaction.atomic():
+        ready = Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'pk')
+        ids = list(ready.select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+        # The status guard keeps two workers from taking the same job on
+        # backends without SKIP LOCKED.
+        Job.objects.filter(pk__in=ids, status='queued').update(status='running', locked_by=token, locked_at=now)
+    return list(Job.objects.filter(locked_by=token, status='running').order_by('pk'))
+
+
+def run(job):
+    handler = registry.get(job.name)
+    try:
+        with transaction.atomic():
+            if handler is None:
+                raise KeyError(f'Unknown job {job.name}')
+            handler(**job.payload)
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+                status='done', attempts=job.attempts + 1, finished=timezone.now(), last_error='',
+            )
+        return True
+    except Exception:
+        attempts = job.attempts + 1
+        failed = attempts >= job.max_attempts
+        logger.exception('Job %s failed (attempt %s/%s)', job, attempts, job.max_attempts)
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            status='failed' if failed else 'queued',
+            attempts=attempts,
+            run_after=timezone.now() + timedelta(seconds=2 ** attempts),
+            locked_by=None,
+            last_error=traceback.format_exc(),
+            finished=timezone.now() if failed else None,
+        )
+        return False
+
+
+def work(batch_size=10, worker=None):
+    """
+    Runs one batch of ready jobs. Returns how many were claimed.
+    """
+    jobs = claim(batch_size, worker)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def work_off(batch_size=100):
+    # Drains the queue in process; used by tests and `run_jobs --once`.
+    total = 0
+    while count := work(batch_size):
+        total += count
+    return total
@@ -0,0 +1,427 @@
+import csv
+import io
+import json
+import math
+import random
+import re
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics import rebuild_sales_rollups
+from .caching import expire_all_products
+from .facets import facet_index
+from .models import (
+    CATEGORY_CHOICES, Cart, Category, Payment, PaymentMethod, Product, ProductAtribute, Profile, Rating, SubCategory,
+)
+from .ratings import rebuild_rating_aggregates
+from .search import get_search_backend
+
+
+ADJECTIVES = ['classic', 'slim', 'organic', 'wireless', 'cotton', 'leather', 'vintage', 'compact', 'deluxe', 'sport']
+NOUNS = ['shirt', 'jacket', 'phone', 'lamp', 'coffee', 'sneaker', 'headset', 'blender', 'backpack', 'watch']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+GENDERS = ['male', 'female', 'unisex']
+
+# Stock that a load test can not run out of.
+PLENTY = 10 ** 6
+
+
+def product_name(rng):
+    return f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randrange(1000)}'
+
+
+def bulk_insert(model, objects, batch_size=1000):
+    """
+    ``bulk_create()`` that leaves the new rows' pks on ``objects`` on every
+    backend. Without RETURNING (MySQL) they are read back in insert order
+    from above the highest pk seen before, which holds while nothing else
+    inserts into the table meanwhile.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    pks = list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+    if len(pks) != len(objects):
+        raise RuntimeError(f'Other {model._meta.verbose_name_plural} were inserted meanwhile; generate the catalog on an idle database.')
+    for obj, pk in zip(objects, pks):
+        obj.pk = pk
+    return objects
+
+
+@transaction.atomic
+def generate_catalog(products=1000, sellers=10, customers=100, shoppers=16, subcategories=4, attributes=3,
+                     ratings=5000, carts=300, payments=5000, days=90, seed=0, password='benchmark'):
+    """
+    Fills the database with a reproducible catalog: the same arguments give
+    the same rows. ``seller-N`` users own the products, ``customer-N`` users
+    rate them, fill carts and pay, and ``shopper-N`` users (all with
+    ``password``) start empty for the load-test scenarios to act as.
+    Returns the number of rows per model.
+    """
+    if User.objects.filter(username='seller-0').exists():
+        raise ValueError('A catalog was already generated in this database.')
+    rng = random.Random(seed)
+    hashed = make_password(password)
+
+    def create_users(prefix, count):
+        return bulk_insert(User, [User(username=f'{prefix}-{i}', password=hashed) for i in range(count)])
+
+    seller_users = create_users('seller', sellers)
+    customer_users = create_users('customer', customers)
+    shopper_users = create_users('shopper', shoppers)
+    Profile.objects.bulk_create([
+        Profile(user=user, address=f'{i} Main St', city='Cairo', country='Egypt')
+        for i, user in enumerate(customer_users + shopper_users)
+    ])
+    method, _ = PaymentMethod.objects.get_or_create(name='visa')
+
+    categories = bulk_insert(Category, [Category(name=name) for name, _ in CATEGORY_CHOICES])
+    taxonomy = bulk_insert(SubCategory, [
+        SubCategory(category=category, name=f'{category.name} {i}', gender=rng.choice(GENDERS))
+        for category in categories
+        for i in range(subcategories)
+    ])
+
+    catalog = bulk_insert(Product, [
+        Product(
+            user=rng.choice(seller_users),
+            subcategory=rng.choice(taxonomy),
+            name=product_name(rng),
+            description=f'{rng.choice(ADJECTIVES)} and {rng.choice(ADJECTIVES)}',
+            price=round(rng.uniform(5, 500), 2),
+            status=rng.random() < 0.9,
+            quantity=PLENTY,
+            discount=rng.choice([0, 0, 0, 10, 20, 50]),
+        )
+        for _ in range(products)
+    ], batch_size=1000)
+    variants = bulk_insert(ProductAtribute, [
+        ProductAtribute(product=product, name='size', value=size, quantity=PLENTY)
+        for product in catalog
+        for size in rng.sample(SIZES, min(attributes, len(SIZES)))
+    ], batch_size=1000)
+
+    content_type = ContentType.objects.get_for_model(Product)
+    rated = {(rng.choice(customer_users).pk, rng.choice(catalog).pk) for _ in range(ratings)}
+    Rating.objects.bulk_create([
+        Rating(user_id=user, content_type=content_type, object_id=product, stars=rng.randint(1, 5))
+        for user, product in sorted(rated)
+    ], batch_size=1000)
+
+    lines = {(rng.choice(customer_users).pk, rng.choice(variants)) for _ in range(carts)}
+    Cart.objects.bulk_create([
+        Cart(user_id=user, product_id=variant.product_id, attribute=variant, quantity=rng.randint(1, 3))
+        for user, variant in sorted(lines, key=lambda line: (line[0], line[1].pk))
+    ], batch_size=1000)
+
+    sold = []
+    for _ in range(payments):
+        product, units = rng.choice(catalog), rng.randint(1, 3)
+        sold.append(Payment(
+            user=rng.choice(customer_users), product=product, method=method,
+            unit_price=product.price, amount=round(product.price * units, 2),
+        ))
+    bulk_insert(Payment, sold)
+    # auto_now_add stamped them all now; spread them over the last days.
+    now = timezone.now()
+    for payment in sold:
+        payment.date = now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+    Payment.objects.bulk_update(sold, ['date'], batch_size=1000)
+
+    rebuild_rating_aggregates()
+    rebuild_sales_rollups()
+    get_search_backend().rebuild()
+    transaction.on_commit(facet_index.rebuild)
+    expire_all_products()
+    return {
+        'users': len(seller_users) + len(customer_users) + len(shopper_users),
+        'categories': len(categories),
+        'subcategories': len(taxonomy),
+        'products': len(catalog),
+        'attributes': len(variants),
+        'ratings': len(rated),
+        'carts': len(lines),
+        'payments': len(sold),
+    }
+
+
+class Catalog:
+    """Ids the scenarios pick from, read once from the database."""
+
+    def __init__(self):
+        self.variants = list(ProductAtribute.objects.order_by('pk').values_list('product_id', 'pk'))
+        self.products = sorted({product for product, _ in self.variants})
+        self.sellers = list(Product.objects.order_by('user_id').values_list('user_id', flat=True).distinct())
+        self.subcategories = list(SubCategory.objects.order_by('pk').values_list('pk', flat=True))
+        self.categories = [name for name, _ in CATEGORY_CHOICES]
+        self.terms = ADJECTIVES + NOUNS
+        if not self.variants:
+            raise ValueError('The catalog is empty; run generate_catalog first.')
+
+    def counts(self):
+        return {
+            'products': Product.objects.count(),
+            'attributes': len(self.variants),
+            'carts': Cart.objects.count(),
+            'payments': Payment.objects.count(),
+        }
+
+
+class TestClientDriver:
+    """Requests through Django's test client, counting queries in process."""
+
+    name = 'test-client'
+
+    def __init__(self, user, password=None):
+        self.user = user
+        # Server errors count as failed requests instead of ending the run.
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(user)
+
+    def request(self, method, path, data=None, files=None):
+        kwargs = {}
+        if files:
+            kwargs = {'data': {name: SimpleUploadedFile(name=filename, content=content) for name, (filename, content) in files.items()}, 'format': 'multipart'}
+        elif data is not None:
+            kwargs = {'data': data, 'format': 'json'}
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method.lower())(path, **kwargs)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body, len(queries)
+
+
+class HTTPDriver:
+    """
+    Requests to a running server, authenticated with a JWT. Queries per
+    request come from the Server-Timing header, so the server needs
+    SERVER_TIMING = True for them; they are None otherwise.
+    """
+
+    def __init__(self, base_url, user, password):
+        self.base_url = base_url.rstrip('/')
+        self.name = self.base_url
+        self.user = user
+        self.token = None
+        status, body, _ = self.request('POST', '/api/token/', {'username': user.username, 'password': password})
+        if status != 200:
+            raise ValueError(f'Could not log in as {user.username} ({status}).')
+        self.token = json.loads(body)['access']
+
+    def request(self, method, path, data=None, files=None):
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        body = None
+        if files:
+            boundary = uuid.uuid4().hex
+            body = b''.join(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+                for name, (filename, content) in files.items()
+            ) + f'--{boundary}--\r\n'.encode()
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, content, timing = response.status, response.read(), response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            status, content, timing = error.code, error.read(), error.headers.get('Server-Timing', '')
+        match = re.search(r'desc="(\d+) queries"', timing)
+        return status, content, int(match.group(1)) if match else None
+
+
+class Session:
+    """One simulated client: runs scenario steps and records each request."""
+
+    def __init__(self, driver, scenario):
+        self.driver = driver
+        self.scenario = scenario
+        self.samples = []
+
+    @property
+    def user_id(self):
+        return self.driver.user.pk
+
+    def call(self, step, method, path, data=None, files=None):
+        started = time.perf_counter()
+        status, body, queries = self.driver.request(method, path, data=data, files=files)
+        self.samples.append((step, status, time.perf_counter() - started, queries))
+        if status >= 400 or not body or not body.lstrip().startswith((b'{', b'[')):
+            return None
+        return json.loads(body)
+
+    def get(self, step, path, **params):
+        return self.call(step, 'GET', f'{path}?{urlencode(params, doseq=True)}' if params else path)
+
+    def clear_cart(self):
+        page = self.driver.request('GET', '/cart/?page_size=100')
+        for line in json.loads(page[1]).get('results', []):
+            self.driver.request('DELETE', f'/cart/{line["id"]}/')
+
+
+def relative(url):
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+def browse(session, rng, catalog):
+    page = session.get('product-list', '/products/')
+    if page and page.get('next'):
+        session.call('product-list-next', 'GET', relative(page['next']))
+    session.get('product-list-filtered', '/products/', category=rng.choice(catalog.categories), attribute=f'size:{rng.choice(SIZES)}')
+    session.get('product-detail', f'/products/{rng.choice(catalog.products)}/')
+    session.get('category-list', '/categories/')
+    session.get('subcategory-list', '/subcategory/')
+
+
+def search(session, rng, catalog):
+    session.get('search', '/search/', search=rng.choice(catalog.terms))
+    session.get('search-filtered', '/search/', search=rng.choice(catalog.terms), category=rng.choice(catalog.categories))
+
+
+def add_to_cart(session, rng, catalog):
+    product, attribute = rng.choice(catalog.variants)
+    line = session.call('cart-create', 'POST', '/cart/', {'user': session.user_id, 'product': product, 'attribute': attribute, 'quantity': 1})
+    session.get('cart-list', '/cart/')
+    if line:
+        session.call('cart-destroy', 'DELETE', f'/cart/{line["id"]}/')
+
+
+def checkout(session, rng, catalog):
+    for product, attribute in rng.sample(catalog.variants, min(2, len(catalog.variants))):
+        session.call('cart-create', 'POST', '/cart/', {'user': session.user_id, 'product': product, 'attribute': attribute, 'quantity': 1})
+    session.call('cart-checkout', 'POST', '/cart/checkout/')
+
+
+def csv_import(session, rng, catalog, rows=100):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['user', 'name', 'subcategory', 'price', 'quantity', 'attribute'])
+    for _ in range(rows):
+        attribute = json.dumps([{'name': 'size', 'value': size, 'quantity': 10} for size in rng.sample(SIZES, 2)])
+        writer.writerow([session.user_id, product_name(rng), rng.choice(catalog.subcategories), round(rng.uniform(5, 500), 2), 100, attribute])
+    session.call('csv-import', 'POST', '/csv/', files={'file': ('products.csv', out.getvalue().encode())})
+
+
+def csv_export(session, rng, catalog):
+    session.get('csv-export', '/csv_export/', seller=rng.choice(catalog.sellers))
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'csv_import': csv_import,
+    'csv_export': csv_export,
+}
+
+
+def percentile(ordered, q):
+    # Nearest rank.
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(samples, seconds=None):
+    if not samples:
+        return {'requests': 0}
+    latencies = sorted(sample[2] * 1000 for sample in samples)
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    summary = {
+        'requests': len(samples),
+        'errors': sum(sample[1] >= 400 for sample in samples),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries_per_request': {
+            'mean': round(statistics.mean(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+    if seconds is not None:
+        summary['seconds'] = round(seconds, 3)
+        summary['requests_per_second'] = round(len(samples) / seconds, 1)
+    return summary
+
+
+def run_scenario(name, driver_factory, users, catalog, iterations=50, concurrency=1, seed=0):
+    """
+    Runs ``iterations`` of scenario ``name`` split over ``concurrency``
+    workers, each acting as its own user with its own seeded random source.
+    Returns the summary of all requests and of each step.
+    """
+    scenario = SCENARIOS[name]
+
+    def work(worker):
+        session = Session(driver_factory(users[worker]), name)
+        session.clear_cart()
+        rng = random.Random(f'{seed}:{name}:{worker}')
+        for _ in range(iterations // concurrency + (worker < iterations % concurrency)):
+            scenario(session, rng, catalog)
+        return session.samples
+
+    def work_in_thread(worker):
+        try:
+            return work(worker)
+        finally:
+            # Each worker thread opened its own connection.
+            connections.close_all()
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        samples = work(0)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = [sample for worker in pool.map(work_in_thread, range(concurrency)) for sample in worker]
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(samples, elapsed)
+    summary['iterations'] = iterations
+    steps = {}
+    for sample in samples:
+        steps.setdefault(sample[0], []).append(sample)
+    summary['steps'] = {step: summarize(step_samples) for step, step_samples in steps.items()}
+    return summary
+
+
+def compare(before, after):
+    """Lines of p95 and queries per request changes between two result files."""
+    lines = []
+    for name, result in after['scenarios'].items():
+        old = before.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        for step, summary in [('all', result), *result['steps'].items()]:
+            previous = old if step == 'all' else old['steps'].get(step)
+            if previous is None:
+                continue
+            p95, was = summary['latency_ms']['p95'], previous['latency_ms']['p95']
+            change = f'{(p95 - was) / was * 100:+.0f}%' if was else 'n/a'
+            lines.append(
+                f'{name:12} {step:22} p95 {was:9.2f} -> {p95:9.2f} ms ({change:>5})  '
+                f'queries {previous["queries_per_request"]["mean"]} -> {summary["queries_per_request"]["mean"]}'
+            )
+    return lines
@@ -0,0 +1,102 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from ecom.urls import router
+
+
+# Read endpoints beyond the router's list routes.
+EXTRA_PATHS = ['/products/dashboard/sales/', '/products/dashboard/top/', '/nnotifications/unread_count/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every viewset list route as a user, EXPLAIN the SELECTs they run and flag '
+        'filtered queries that scan a whole table instead of using an index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to make the requests as (defaults to the first user).')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a scan is flagged.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first() if options['user'] else User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('The audit needs a user in the database.')
+        paths = [f'/{prefix}/' for prefix, viewset, basename in router.registry] + EXTRA_PATHS
+
+        flagged = 0
+        for path in paths:
+            queries = self.capture(path, user)
+            self.stdout.write(f'GET {path}: {len(queries)} queries')
+            for sql, params in queries:
+                plan = explain(sql, params)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {sql}\n' + ''.join(f'    {line}\n' for line in plan))
+                # Unfiltered selects read the whole table by design.
+                if ' WHERE ' not in sql:
+                    continue
+                for table in scanned_tables(plan):
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(f'  full scan of {table}: {sql[:200]}'))
+
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} queries scan a whole table.')
+        self.stdout.write(self.style.SUCCESS(f'Audited {len(paths)} routes, {flagged} full scans.'))
+
+    def capture(self, path, user):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        # Reads only, but roll back anything a view writes on the way.
+        with override_settings(ALLOWED_HOSTS=['testserver']), transaction.atomic(), connection.execute_wrapper(record):
+            response = client.get(path)
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            self.stdout.write(self.style.ERROR(f'  {response.status_code} from {path}'))
+        return queries
+
+
+def explain(sql, params):
+    vendor = connection.vendor
+    prefix = 'EXPLAIN QUERY PLAN' if vendor == 'sqlite' else 'EXPLAIN'
+    with transaction.atomic(), connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan; ask which indexes exist
+            # for the query rather than what this data size would pick.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'{prefix} {sql}', params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    if vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    if vendor == 'mysql':
+        return [' '.join(f'{column}={value}' for column, value in zip(columns, row)) for row in rows]
+    return [row[0] for row in rows]
+
+
+def scanned_tables(plan):
+    vendor = connection.vendor
+    for line in plan:
+        if vendor == 'sqlite':
+            match = re.match(r'\s*SCAN (\w+)\b(?! USING)', line)
+            if match and match.group(1) != 'CONSTANT':
+                yield match.group(1)
+        elif vendor == 'mysql':
+            match = re.search(r'\btable=(\w+).* type=ALL\b', line)
+            if match:
+                yield match.group(1)
+        else:
+            match = re.search(r'Seq Scan on (\w+)', line)
+            if match:
+                yield match.group(1)
@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from ecom.models import Product
+
+
+PATHS = ['/products/', '/products/{product}/', '/categories/', '/subcategory/', '/search/?search={term}', '/cart/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare read throughput of the synchronous DRF views behind the WSGI handler with the '
+        'async views behind the ASGI handler, in process and on the current database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path and handler.')
+        parser.add_argument('--concurrency', type=int, default=16, help='WSGI threads / in-flight ASGI requests.')
+        parser.add_argument('--user', help='Username to read the cart as (defaults to the first user).')
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by('-date', '-id').first()
+        user = User.objects.filter(username=options['user']).first() if options['user'] else User.objects.first()
+        if product is None or user is None:
+            raise CommandError('The benchmark needs at least one user and one product in the database.')
+        paths = [path.format(product=product.pk, term=product.name.split()[0]) for path in PATHS]
+
+        self.stdout.write(f'{Product.objects.count()} products, {options["requests"]} requests per path, concurrency {options["concurrency"]}')
+        self.stdout.write(f'{"path":40} {"wsgi req/s":>11} {"asgi req/s":>11} {"wsgi p95 ms":>12} {"asgi p95 ms":>12}')
+        for path in paths:
+            wsgi = self.run_wsgi(path, user, options['requests'], options['concurrency'])
+            asgi = self.run_asgi(path, user, options['requests'], options['concurrency'])
+            self.stdout.write(f'{path:40} {wsgi[0]:11.0f} {asgi[0]:11.0f} {wsgi[1]:12.1f} {asgi[1]:12.1f}')
+
+    def run_wsgi(self, path, user, requests, concurrency):
+        client = Client()
+        client.force_login(user)
+
+        def get(i):
+            started = time.perf_counter()
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+            elapsed = time.perf_counter() - started
+            # Each thread opened its own connection, as under a threaded server.
+            connections.close_all()
+            return elapsed
+
+        with override_settings(ROOT_URLCONF='ecommerce.urls', ALLOWED_HOSTS=['testserver']):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(get, range(requests)))
+            return summarize(latencies, time.perf_counter() - started)
+
+    def run_asgi(self, path, user, requests, concurrency):
+        client = AsyncClient()
+        client.force_login(user)
+
+        async def run():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def get():
+                async with slots:
+                    started = time.perf_counter()
+                    response = await client.get(path)
+                    assert response.status_code == 200, (path, response.status_code)
+                    return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*[get() for _ in range(requests)])
+            return summarize(latencies, time.perf_counter() - started)
+
+        with override_settings(ROOT_URLCONF='ecommerce.asgi_urls', ALLOWED_HOSTS=['testserver']):
+            return asyncio.run(run())
+
+
+def summarize(latencies, elapsed):
+    # (requests per second, p95 latency in ms)
+    return len(latencies) / elapsed, statistics.quantiles(latencies, n=20)[-1] * 1000
@@ -0,0 +1,51 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from ecom.models import Product
+from ecom.serializers import ProductRowSerializer, ProductSerializer
+from ecom.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Time ProductSerializer against ProductRowSerializer on up to --size products from the current '
+        'database; load a 10k catalog first with `manage.py generate_catalog --products 10000`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='Products to serialize.')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per serializer.')
+
+    def handle(self, *args, **options):
+        queryset = ProductViewSet.queryset.order_by('-date', '-id')[:options['size']]
+        size = min(options['size'], Product.objects.count())
+        if not size:
+            raise CommandError('The benchmark needs products in the database.')
+        if size < options['size']:
+            self.stderr.write(self.style.WARNING(f'Only {size} products in the database, serializing all of them.'))
+
+        def model_serializer():
+            return JSONRenderer().render(ProductSerializer(list(queryset), many=True).data)
+
+        def row_serializer():
+            rows = list(ProductRowSerializer.values(queryset))
+            return JSONRenderer().render(ProductRowSerializer.for_rows(rows).data)
+
+        if model_serializer() != row_serializer():
+            raise CommandError('The serializers disagree; fix ProductRowSerializer first.')
+
+        self.stdout.write(f'{size} products, median of {options["repeat"]} runs (queries included)')
+        baseline = None
+        for name, func in [('ProductSerializer', model_serializer), ('ProductRowSerializer', row_serializer)]:
+            median = statistics.median(timed(func) for _ in range(options['repeat'])) * 1000
+            baseline = baseline or median
+            self.stdout.write(f'{name:22} {median:8.2f} ms  x{baseline / median:.1f}')
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
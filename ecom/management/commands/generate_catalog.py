@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecom.loadtest import generate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty database with a reproducible benchmark catalog: taxonomy, products with attributes, ratings, carts and payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--sellers', type=int, default=10)
+        parser.add_argument('--customers', type=int, default=100, help='Users with ratings, carts and payments.')
+        parser.add_argument('--shoppers', type=int, default=16, help='Empty users for the load-test workers, one per worker.')
+        parser.add_argument('--subcategories', type=int, default=4, help='Subcategories per category.')
+        parser.add_argument('--attributes', type=int, default=3, help='Size attributes per product.')
+        parser.add_argument('--ratings', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=300)
+        parser.add_argument('--payments', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=90, help='Payments are spread over this many past days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='benchmark', help='Password of every generated user.')
+
+    def handle(self, *args, **options):
+        try:
+            counts = generate_catalog(**{
+                name: options[name]
+                for name in ('products', 'sellers', 'customers', 'shoppers', 'subcategories', 'attributes', 'ratings', 'carts', 'payments', 'days', 'seed', 'password')
+            })
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS('Generated ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecom.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating aggregates stored on every product.'
+
+    def handle(self, *args, **options):
+        rated = rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {rated} rated products.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecom.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily product and seller sales rollups from every payment.'
+
+    def handle(self, *args, **options):
+        written = rebuild_sales_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} daily product sales rollups.'))
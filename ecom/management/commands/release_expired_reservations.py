@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecom.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock held by expired checkout reservations.'
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations.'))
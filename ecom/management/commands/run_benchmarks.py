@@ -0,0 +1,84 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from ecom.loadtest import SCENARIOS, Catalog, HTTPDriver, TestClientDriver, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the load-test scenarios against the test client (default) or a running server and write '
+        'p50/p95/p99 latency and queries per request, overall and per step, to a JSON file. '
+        'Expects a database filled by generate_catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Any of {", ".join(SCENARIOS)}; all by default.')
+        parser.add_argument('--iterations', type=int, default=50, help='Scenario runs, split over the workers.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Workers, each acting as its own shopper.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url', help='Base URL of a running server sharing this database, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--password', default='benchmark', help='Shopper password, for --url.')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', help='Earlier results file to print p95 and query changes against.')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}.')
+        users = list(User.objects.filter(username__startswith='shopper-').order_by('pk')[:options['concurrency']])
+        if len(users) < options['concurrency']:
+            raise CommandError(f'Need {options["concurrency"]} shopper users; run generate_catalog with --shoppers.')
+        try:
+            catalog = Catalog()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['url']:
+            def driver(user):
+                return HTTPDriver(options['url'], user, options['password'])
+            target = options['url']
+        else:
+            driver, target = TestClientDriver, TestClientDriver.name
+
+        results = {
+            'created': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'target': target,
+            'database': connection.vendor,
+            'options': {name: options[name] for name in ('iterations', 'concurrency', 'seed')},
+            'catalog': catalog.counts(),
+            'scenarios': {},
+        }
+        with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+            for name in scenarios:
+                result = run_scenario(name, driver, users, catalog, options['iterations'], options['concurrency'], options['seed'])
+                results['scenarios'][name] = result
+                latency, queries = result['latency_ms'], result['queries_per_request']['mean']
+                self.stdout.write(
+                    f'{name:12} {result["requests"]:6} requests {result["requests_per_second"]:8.1f}/s  '
+                    f'p50 {latency["p50"]:8.2f}  p95 {latency["p95"]:8.2f}  p99 {latency["p99"]:8.2f} ms  '
+                    f'{queries} queries/request  {result["errors"]} errors'
+                )
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
+        if options['compare']:
+            with open(options['compare']) as f:
+                for line in compare(json.load(f), results):
+                    self.stdout.write(line)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR).stdout.strip() or None
+    except OSError:
+        return None
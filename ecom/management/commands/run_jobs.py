@@ -0,0 +1,54 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ecom.jobs import work, work_off
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers against the database job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per poll.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write(self.style.SUCCESS(f'Ran {work_off(options["batch"])} jobs.'))
+            return
+
+        # Children must open their own database connections.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_loop, args=(f'worker-{i}', options['batch'], options['sleep']), daemon=True)
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} job workers.')
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+
+def worker_loop(name, batch, sleep):
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        if not work(batch, worker=name):
+            connections.close_all()
+            time.sleep(sleep)
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS ecom_product_search USING fts5("
+        "name, description, taxonomy, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO ecom_product_search (rowid, name, description, taxonomy) "
+        "SELECT p.id, p.name, COALESCE(p.description, ''), s.name || ' ' || c.name "
+        "FROM ecom_product p "
+        "JOIN ecom_subcategory s ON s.id = p.subcategory_id "
+        "JOIN ecom_category c ON c.id = s.category_id"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS ecom_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0014_product_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
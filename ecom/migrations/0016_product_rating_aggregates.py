@@ -0,0 +1,88 @@
+# Generated by Django 5.0 on 2026-10-18 08:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Product = apps.get_model('ecom', 'Product')
+    Rating = apps.get_model('ecom', 'Rating')
+    content_type = ContentType.objects.filter(app_label='ecom', model='product').first()
+    if content_type is None:
+        return
+    rows = (
+        Rating.objects.filter(content_type=content_type)
+        .values('object_id')
+        .annotate(count=Count('id'), total=Sum('stars'), **{f'stars_{i}': Count('id', filter=Q(stars=i)) for i in range(1, 6)})
+        .order_by()
+    )
+    for row in rows:
+        Product.objects.filter(pk=row['object_id']).update(
+            rating_count=row['count'],
+            rating_total=row['total'],
+            rating_average=row['total'] / row['count'],
+            **{f'stars_{i}': row[f'stars_{i}'] for i in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('ecom', '0015_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_average', '-rating_count', '-id'], name='product_top_rated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['content_type', 'object_id'], name='rating_object_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0 on 2026-10-18 09:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # Duplicate cart lines are merged into the oldest one, duplicate
+    # wishlist entries dropped, before the unique constraints go in.
+    for model, fields in [('Cart', ['user', 'product', 'attribute']), ('Wishlist', ['user', 'product'])]:
+        model = apps.get_model('ecom', model)
+        totals = {'quantity': Sum('quantity')} if model.__name__ == 'Cart' else {}
+        duplicates = model.objects.values(*fields).annotate(count=Count('id'), keep=Min('id'), **totals).filter(count__gt=1).order_by()
+        for row in duplicates:
+            model.objects.filter(**{field: row[field] for field in fields}).exclude(pk=row['keep']).delete()
+            if totals:
+                model.objects.filter(pk=row['keep']).update(quantity=row['quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0022_daily_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='nnotification',
+            index=models.Index(fields=['user', '-date', '-id'], name='nnotification_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', '-date', '-id'], name='product_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipping',
+            index=models.Index(fields=['user', 'status'], name='shipping_user_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('attribute__isnull', False)), fields=('user', 'product', 'attribute'), name='cart_user_product_attribute_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('attribute__isnull', True)), fields=('user', 'product'), name='cart_user_product_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='wishlist_user_product_uniq'),
+        ),
+    ]
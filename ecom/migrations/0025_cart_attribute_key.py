@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 09:59
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # MySQL ignored the conditional constraints this replaces: merge any
+    # duplicate lines into the oldest one first, as 0023 did elsewhere.
+    Cart = apps.get_model('ecom', 'Cart')
+    fields = ['user', 'product', 'attribute']
+    duplicates = Cart.objects.values(*fields).annotate(count=Count('id'), keep=Min('id'), total=Sum('quantity')).filter(count__gt=1).order_by()
+    for row in duplicates:
+        Cart.objects.filter(**{field: row[field] for field in fields}).exclude(pk=row['keep']).delete()
+        Cart.objects.filter(pk=row['keep']).update(quantity=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0024_catalog_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='cart',
+            name='cart_user_product_attribute_uniq',
+        ),
+        migrations.RemoveConstraint(
+            model_name='cart',
+            name='cart_user_product_uniq',
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='attribute_key',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Coalesce('attribute', 0), output_field=models.IntegerField()),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product', 'attribute_key'), name='cart_user_product_attribute_key_uniq'),
+        ),
+    ]
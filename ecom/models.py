@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import  User
+from django.utils import timezone
 
 STATUS_CHOICES = [
     ('delivered', 'Delivered'),
@@ -55,6 +57,12 @@ class SubCategory(models.Model):
 
 
 
+RATING_AGGREGATE_FIELDS = {
+    'rating_count', 'rating_total', 'rating_average',
+    'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5',
+}
+
+
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -66,14 +74,56 @@ class Product(models.Model):
     quantity = models.IntegerField(default=0)
     discount = models.IntegerField(default=0, null=True, blank=True)  # Discount percentage
     date = models.DateField(auto_now_add=True)
+    # Also moved by the queryset.update() writers in ecom.stock and
+    # ecom.ratings, and by attribute changes; see ecom.conditional.
+    modified = models.DateTimeField(auto_now=True)
+    # Rating aggregates, maintained by ecom.ratings alongside Rating writes.
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
     
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='product_date_id_idx'),
+            models.Index(fields=['modified'], name='product_modified_idx'),
+            models.Index(fields=['-rating_average', '-rating_count', '-id'], name='product_top_rated_idx'),
+            models.Index(fields=['user', '-date', '-id'], name='product_user_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Rating aggregates only move through ecom.ratings' UPDATEs; a full
+        # save of a stale instance must not write them back.
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_AGGREGATE_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted discount so saves can tell it went up.
+        if 'discount' in instance.__dict__:
+            instance._loaded_discount = instance.discount
+        return instance
+
     @property
     def price_with_discount(self):
         return self.price * (1 - self.discount / 100)
 
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
     def __str__(self):
         return self.name
     
@@ -98,6 +148,9 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('user', 'content_type', 'object_id')
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='rating_object_idx'),
+        ]
 
     def __str__(self):
         product = self.content_object
@@ -134,7 +187,20 @@ class Payment(models.Model):
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    attribute = models.ForeignKey(ProductAtribute, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.IntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+    # The attribute, 0 for none: NULLs never collide in a unique index, and
+    # MySQL ignores the conditional ones that would work around it.
+    attribute_key = models.GeneratedField(
+        expression=Coalesce('attribute', 0), output_field=models.IntegerField(), db_persist=True,
+    )
+
+    class Meta:
+        # One line per product and attribute.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product', 'attribute_key'], name='cart_user_product_attribute_key_uniq'),
+        ]
 
     def total_price(self):
         return self.product.price * self.quantity
@@ -143,6 +209,33 @@ class Cart(models.Model):
         return self.user.username
 
 
+RESERVATION_STATUS_CHOICES = [
+    ('held', 'Held'),
+    ('sold', 'Sold'),
+    ('released', 'Released'),
+]
+
+
+class StockReservation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    attribute = models.ForeignKey(ProductAtribute, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=RESERVATION_STATUS_CHOICES, default='held')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+            models.Index(fields=['user', 'product', 'status'], name='reservation_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for {self.user_id} ({self.status})'
+
+
 class NNotification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -154,14 +247,38 @@ class NNotification(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'seen', '-date'], name='nnotification_inbox_idx'),
+            models.Index(fields=['user', '-date', '-id'], name='nnotification_user_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class UnreadCounter(models.Model):
+    # Cached unread badge (NNotification + django-notifications-hq), kept in
+    # step by ecom.unread and recounted when stale.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    unread = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.unread}'
+
+
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'user'], name='wishlist_product_user_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='wishlist_user_product_uniq'),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -173,6 +290,89 @@ class Shipping(models.Model):
     city = models.CharField(max_length=100)
     status = models.CharField(max_length=100, choices=STATUS_CHOICES)
     country = models.CharField(max_length=100)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='shipping_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return self.user.username
+
+
+JOB_STATUS_CHOICES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+]
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    idempotency_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_ready_idx'),
+            models.Index(fields=['locked_by'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class ProductDailySales(models.Model):
+    # Payments rolled up per product and day by ecom.analytics, which keeps
+    # the seller dashboards from scanning Payment.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    revenue = models.FloatField(default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='product_sales_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} on {self.day}: {self.revenue}'
+
+
+class SellerDailySales(models.Model):
+    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    revenue = models.FloatField(default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('seller', 'day')
+
+    def __str__(self):
+        return f'{self.seller_id} on {self.day}: {self.revenue}'
+
+
+class CatalogChange(models.Model):
+    # When rows were last deleted from a table, by name, kept by
+    # ecom.signals: with the newest ``modified`` it validates a list without
+    # counting the table; see ecom.conditional.
+    name = models.CharField(max_length=50, primary_key=True)
+    deleted = models.DateTimeField()
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return f'{self.name} at {self.deleted}'
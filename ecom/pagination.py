@@ -0,0 +1,178 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardPageNumberPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a full ``ordering`` key.
+
+    DRF's ``CursorPagination`` only seeks on the first ordering field and
+    falls back to an offset for rows sharing that value, which degrades on
+    columns like ``Product.date``. Here the cursor stores every ordering
+    value, so each page is a ``WHERE (date, id) < (...)`` seek whatever its
+    depth. The last ordering field must be unique.
+
+    Subclasses may offer alternative keys in ``orderings``, picked with
+    ``?ordering=<name>``. Passing ``?page=`` switches to page-number
+    pagination for admin tools that need totals and random access.
+    """
+    ordering = ('id',)
+    orderings = {}
+    ordering_query_param = 'ordering'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+    page_number_class = StandardPageNumberPagination
+
+    delegate = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        if self.delegate is not None:
+            return self.delegate.paginate_queryset(page, request, view)
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        if self.delegate is not None:
+            return await sync_to_async(self.delegate.paginate_queryset)(page, request, view)
+        return self.set_page([instance async for instance in page])
+
+    def page_queryset(self, queryset, request, view=None):
+        # The query for the requested page, one row past it to tell whether
+        # there is a next page, or the ordered queryset for the delegate.
+        self.ordering = self.orderings.get(request.query_params.get(self.ordering_query_param), self.ordering)
+        if self.page_number_class is not None and self.page_number_class.page_query_param in request.query_params:
+            self.delegate = self.page_number_class()
+            return queryset.order_by(*self.ordering)
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.seek(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = results
+        return results
+
+    def seek(self, ordering, position):
+        # (a, b, c) after (x, y, z) == a > x OR (a = x AND b > y) OR ...
+        conditions = []
+        for i, name in enumerate(ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {field.attname: value for field, value in zip(self.fields[:i], position[:i])}
+            conditions.append(Q(**equal, **{f'{self.fields[i].attname}__{lookup}': position[i]}))
+        return reduce(or_, conditions)
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values = cursor['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+            return position, bool(cursor.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict):
+            # A .values() row; it must include the ordering columns.
+            instance = self.model(**{field.attname: instance[field.attname] for field in self.fields})
+        values = [field.value_to_string(instance) for field in self.fields]
+        cursor = {'p': values, 'r': 1} if reverse else {'p': values}
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(remove_query_param(self.base_url, 'page'), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+    orderings = {
+        'newest': ('-date', '-id'),
+        'top_rated': ('-rating_average', '-rating_count', '-id'),
+        'most_rated': ('-rating_count', '-id'),
+    }
+
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('-date', '-id')
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+SUBSCRIBER_QUEUE_SIZE = getattr(settings, 'NOTIFICATION_STREAM_QUEUE_SIZE', 100)
+
+
+class BaseBroker:
+    """
+    Fan-out of messages to the subscribers of a channel. ``publish`` may be
+    called from any thread; ``subscribe`` is an async context manager
+    yielding an ``asyncio.Queue`` of messages.
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """
+    In-process broker. Messages only reach subscribers in the process that
+    published them; streams resync from the database to pick up the rest.
+    A slow subscriber whose queue is full misses messages rather than
+    blocking the publisher.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(offer, queue, message)
+            except RuntimeError:
+                # The subscriber's event loop is already closed.
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self.lock:
+            self.subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                self.subscribers[channel].discard(subscriber)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+
+def offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', 'ecom.pubsub.LocalBroker'))()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'notifications:{user_id}'
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'id': notification.pk,
+        'verb': notification.verb,
+        'description': notification.description,
+        'timestamp': notification.timestamp.isoformat(),
+    }
+
+
+def nnotification_event(notification):
+    return {
+        'type': 'nnotification',
+        'id': notification.pk,
+        'title': notification.title,
+        'message': notification.message,
+        'product': notification.product_id,
+        'date': notification.date.isoformat(),
+    }
+
+
+def publish_on_commit(user_id, event):
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), event))
@@ -0,0 +1,102 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .caching import expire_all_products
+from .models import Product, Rating
+
+
+def aggregate_update(count=0, total=0, added=None, removed=None):
+    """
+    UPDATE arguments that move a product's rating aggregates by the given
+    deltas in a single statement. The right hand sides all read the
+    pre-update row, so the average is computed from the new totals.
+    """
+    values = {
+        'rating_count': F('rating_count') + count,
+        'rating_total': F('rating_total') + total,
+        'rating_average': Coalesce(
+            Cast(F('rating_total') + total, FloatField()) / NullIf(F('rating_count') + count, Value(0)),
+            Value(0.0),
+        ),
+        'modified': timezone.now(),
+    }
+    if added is not None:
+        values[f'stars_{added}'] = F(f'stars_{added}') + 1
+    if removed is not None:
+        if removed == added:
+            del values[f'stars_{added}']
+        else:
+            values[f'stars_{removed}'] = F(f'stars_{removed}') - 1
+    return values
+
+
+@transaction.atomic
+def rate_product(user, product, stars):
+    """
+    Records ``user``'s rating of ``product`` (replacing an earlier one) and
+    updates the product's aggregates in the same transaction. Returns
+    ``(rating, created)``.
+    """
+    content_type = ContentType.objects.get_for_model(Product)
+    # The row lock on the rating only exists once it does: lock the product
+    # first, so two first ratings by the same user can not both insert. The
+    # aggregate UPDATE below would hold this lock until commit anyway.
+    Product.objects.select_for_update().filter(pk=product.pk).values_list('pk').first()
+    rating = Rating.objects.select_for_update().filter(user=user, content_type=content_type, object_id=product.pk).first()
+    if rating is None:
+        rating = Rating.objects.create(user=user, stars=stars, content_type=content_type, object_id=product.pk)
+        Product.objects.filter(pk=product.pk).update(**aggregate_update(count=1, total=stars, added=stars))
+        return rating, True
+
+    previous = rating.stars
+    if previous != stars:
+        rating.stars = stars
+        rating.save(update_fields=['stars'])
+        Product.objects.filter(pk=product.pk).update(**aggregate_update(total=stars - previous, added=stars, removed=previous))
+    return rating, False
+
+
+def unrate_product(rating):
+    Product.objects.filter(pk=rating.object_id).update(**aggregate_update(count=-1, total=-rating.stars, removed=rating.stars))
+
+
+@transaction.atomic
+def rebuild_rating_aggregates():
+    """
+    Recomputes every product's aggregates from the Rating table with one
+    GROUP BY. Returns the number of rated products.
+    """
+    content_type = ContentType.objects.get_for_model(Product)
+    Product.objects.update(
+        rating_count=0, rating_total=0, rating_average=0,
+        stars_1=0, stars_2=0, stars_3=0, stars_4=0, stars_5=0, modified=timezone.now(),
+    )
+    rows = (
+        Rating.objects.filter(content_type=content_type)
+        .values('object_id')
+        .annotate(
+            count=Count('id'),
+            total=Sum('stars'),
+            **{f'stars_{stars}': Count('id', filter=Q(stars=stars)) for stars in range(1, 6)},
+        )
+        .order_by()
+    )
+    fields = ['rating_count', 'rating_total', 'rating_average', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+    rated, batch = 0, []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(Product(
+            pk=row['object_id'],
+            rating_count=row['count'],
+            rating_total=row['total'],
+            rating_average=row['total'] / row['count'],
+            **{f'stars_{stars}': row[f'stars_{stars}'] for stars in range(1, 6)},
+        ))
+        if len(batch) == 1000:
+            Product.objects.bulk_update(batch, fields)
+            rated, batch = rated + len(batch), []
+    Product.objects.bulk_update(batch, fields)
+    expire_all_products()
+    return rated + len(batch)
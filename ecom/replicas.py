@@ -0,0 +1,240 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Aliases in DATABASES that replicate the default database.
+REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+# Replicas further behind than this are skipped until they catch up.
+REPLICA_MAX_LAG_SECONDS = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 2)
+REPLICA_LAG_CHECK_SECONDS = getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 5)
+# How long a user reads from the primary after a write. Replicas in use are
+# at most REPLICA_MAX_LAG_SECONDS behind when checked and may fall further
+# behind until the next check, so this covers both. Pins are kept in the
+# default cache, which must be shared by all processes for them to follow
+# the user to another worker.
+REPLICA_PIN_SECONDS = getattr(
+    settings, 'REPLICA_PIN_SECONDS', REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS + 3,
+)
+
+# The replica the current request reads from; None reads from the primary.
+reading_from = ContextVar('ecom_reading_from', default=None)
+
+
+def replica_lag(alias):
+    """
+    Seconds ``alias`` trails the primary by, as the database reports it, or
+    ``None`` when replication is not running.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Zero when all WAL received has been replayed: an idle primary
+            # writes nothing new, so the last replay time only ages.
+            cursor.execute(
+                'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+            )
+            return cursor.fetchone()[0]
+        if connection.vendor == 'mysql':
+            cursor.execute('SHOW REPLICA STATUS')
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, row))['Seconds_Behind_Source']
+    if connection.vendor == 'sqlite':
+        return sqlite_lag(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'], connection.settings_dict['NAME'])
+    return 0
+
+
+def sqlite_lag(primary, replica):
+    # A copy of the primary's file standing in for a replica: it trails by
+    # as much as its last change is older than the primary's.
+    def changed(name):
+        paths = [path for path in (str(name), f'{name}-wal') if os.path.exists(path)]
+        return max(os.path.getmtime(path) for path in paths) if paths else None
+
+    primary_changed, replica_changed = changed(primary), changed(replica)
+    if primary_changed is None or replica_changed is None:
+        return 0
+    return max(primary_changed - replica_changed, 0)
+
+
+class LagMonitor:
+    """
+    Replication lag per replica, checked at most every ``interval`` seconds
+    per process. A replica that can not be reached counts as lagging.
+    """
+
+    def __init__(self, interval=REPLICA_LAG_CHECK_SECONDS):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def lag(self, alias):
+        with self.lock:
+            entry = self.checked.get(alias)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            logger.warning('Could not check the lag of replica %s', alias, exc_info=True)
+            lag = None
+        lag = float('inf') if lag is None else float(lag)
+        with self.lock:
+            self.checked[alias] = (time.monotonic() + self.interval, lag)
+        return lag
+
+    def available(self):
+        return [alias for alias in REPLICAS if self.lag(alias) <= REPLICA_MAX_LAG_SECONDS]
+
+    def clear(self):
+        with self.lock:
+            self.checked.clear()
+
+
+lag_monitor = LagMonitor()
+
+
+def pin_key(user_pk):
+    return f'replica-pin:{user_pk}'
+
+
+def pin(user):
+    cache.set(pin_key(user.pk), 1, REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return cache.get(pin_key(user.pk)) is not None
+
+
+def choose_replica(user=None):
+    """
+    A replica in sync for ``user`` to read from, or ``None`` to read from
+    the primary: when there are no replicas, all of them lag, or the user
+    wrote something in the last REPLICA_PIN_SECONDS.
+    """
+    if not REPLICAS or (user is not None and user.is_authenticated and is_pinned(user)):
+        return None
+    available = lag_monitor.available()
+    return random.choice(available) if available else None
+
+
+@contextmanager
+def primary_reads():
+    """
+    Reads in the block go to the primary. For anything kept beyond the
+    request: a cache filled from a replica right after an invalidation
+    would hold the stale data until it expires.
+    """
+    token = reading_from.set(None)
+    try:
+        yield
+    finally:
+        reading_from.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica picked for the request by
+    ``ReplicaReadsMixin`` and everything else, including reads through
+    objects loaded from a replica, to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return reading_from.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication.
+        return False if db in REPLICAS else None
+
+
+class ReplicaReadsMixin:
+    """
+    Serves a view's GET, HEAD and OPTIONS requests from a replica, one per
+    request, unless the user is pinned to the primary by a recent write.
+    ``read_database`` is the alias chosen (``None`` for the primary) for
+    querysets evaluated after the view returns, as by streaming responses.
+    """
+    read_database = None
+
+    def dispatch(self, request, *args, **kwargs):
+        # Reset however the view exits: worker threads outlive the request.
+        token = reading_from.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            reading_from.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication, which reads the user from the primary.
+        super().initial(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            self.read_database = choose_replica(request.user)
+            reading_from.set(self.read_database)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins the user to the primary for REPLICA_PIN_SECONDS after a successful
+    POST, PUT, PATCH or DELETE, so their next reads see what they wrote.
+    Goes after AuthenticationMiddleware; users authenticated by DRF are
+    known by the time the response comes back.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if wrote(request, response):
+            self.pin_user(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if wrote(request, response):
+            # A session user is loaded lazily, with a query.
+            await sync_to_async(self.pin_user)(request)
+        return response
+
+    def pin_user(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin(user)
+
+
+def wrote(request, response):
+    return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and response.status_code < 400
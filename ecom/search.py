@@ -0,0 +1,280 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Product
+from .replicas import primary_reads
+
+
+SEARCH_RESULT_LIMIT = getattr(settings, 'PRODUCT_SEARCH_RESULT_LIMIT', 1000)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def product_documents(ids=None):
+    queryset = Product.objects.all()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    columns = ('pk', 'name', 'description', 'subcategory__name', 'subcategory__category__name')
+    for pk, name, description, subcategory, category in queryset.values_list(*columns).iterator(chunk_size=2000):
+        yield pk, name, description or '', f'{subcategory} {category}'
+
+
+class BaseSearchBackend:
+    """
+    Ranked product search. ``search`` returns product ids, best match first;
+    the last query term is matched as a prefix so partial words work while
+    typing.
+    """
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        raise NotImplementedError
+
+    def index_products(self, ids):
+        raise NotImplementedError
+
+    def remove_products(self, ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Matches in the database with ``icontains``, so every worker sees the
+    same, current results on any database and there is no index to keep.
+    Each term has to match the name, description or taxonomy; a match in the
+    name counts double. Scans the catalog, so large ones want a full-text
+    backend.
+    """
+    weights = {'name': 2, 'description': 1, 'subcategory__name': 1, 'subcategory__category__name': 1}
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        queryset = Product.objects.all()
+        score = Value(0)
+        for term in terms:
+            queryset = queryset.filter(reduce(or_, (Q(**{f'{field}__icontains': term}) for field in self.weights)))
+            for field, weight in self.weights.items():
+                score += Case(When(**{f'{field}__icontains': term}, then=Value(weight)), default=Value(0), output_field=IntegerField())
+        return list(queryset.annotate(score=score).order_by('-score', '-pk').values_list('pk', flat=True)[:limit])
+
+    def index_products(self, ids):
+        pass
+
+    def remove_products(self, ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Inverted index (token -> {product id: term frequency}) kept in process
+    and ranked with BM25. Built from the database on first use and kept
+    current by the Product/SubCategory/Category signals, which only reach
+    the process that made the write: for a single process only, it is
+    never picked by default.
+    """
+    k1 = 1.2
+    b = 0.75
+    name_weight = 2
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.postings = defaultdict(dict)
+        self.tokens = []
+        self.documents = {}
+        self.total_length = 0
+
+    def ensure_built(self):
+        if not self.built:
+            self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.tokens = []
+            self.documents = {}
+            self.total_length = 0
+            with primary_reads():
+                for document in product_documents():
+                    self.add(*document)
+            self.built = True
+
+    def index_products(self, ids):
+        with self.lock:
+            if not self.built:
+                return
+            ids = set(ids)
+            self.discard(ids)
+            for document in product_documents(ids):
+                self.add(*document)
+
+    def remove_products(self, ids):
+        with self.lock:
+            if self.built:
+                self.discard(ids)
+
+    def add(self, pk, name, description, taxonomy):
+        terms = tokenize(name) * self.name_weight + tokenize(description) + tokenize(taxonomy)
+        frequencies = defaultdict(int)
+        for term in terms:
+            frequencies[term] += 1
+        for term, frequency in frequencies.items():
+            if term not in self.postings:
+                insort(self.tokens, term)
+            self.postings[term][pk] = frequency
+        self.documents[pk] = (len(terms), tuple(frequencies))
+        self.total_length += len(terms)
+
+    def discard(self, ids):
+        for pk in ids:
+            length, terms = self.documents.pop(pk, (0, ()))
+            self.total_length -= length
+            for term in terms:
+                posting = self.postings[term]
+                posting.pop(pk, None)
+                if not posting:
+                    del self.postings[term]
+                    del self.tokens[bisect_left(self.tokens, term)]
+
+    def expand(self, prefix):
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + '\U0010ffff')
+        return self.tokens[start:end]
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            self.ensure_built()
+            count = len(self.documents)
+            if not count:
+                return []
+            average = self.total_length / count
+
+            scores = None
+            for i, term in enumerate(terms):
+                expansions = self.expand(term) if i == len(terms) - 1 else [term] if term in self.postings else []
+                term_scores = defaultdict(float)
+                for token in expansions:
+                    posting = self.postings[token]
+                    idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for pk, frequency in posting.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.documents[pk][0] / average)
+                        term_scores[pk] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                # Every term has to match; scores add up across terms.
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [pk for pk, _ in ranked[:limit]]
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """
+    Keeps the index in an FTS5 virtual table next to the catalog (created by
+    migration 0015), so every worker shares it. Updates run once the
+    writing transaction has committed (``transaction.on_commit``), in their
+    own statements: a crash in between leaves the index behind until
+    ``rebuild_search_index``. Ranking uses FTS5's built-in bm25() with the
+    name column weighted up.
+    """
+    table = 'ecom_product_search'
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, 2.0, 1.0, 1.0) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_products(self, ids):
+        ids = list(ids)
+        with connection.cursor() as cursor:
+            self.delete(cursor, ids)
+            self.insert(cursor, product_documents(ids))
+
+    def remove_products(self, ids):
+        with connection.cursor() as cursor:
+            self.delete(cursor, list(ids))
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            self.insert(cursor, product_documents())
+
+    def insert(self, cursor, documents):
+        while True:
+            batch = list(islice(documents, 2000))
+            if not batch:
+                break
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, description, taxonomy) VALUES (%s, %s, %s, %s)',
+                batch,
+            )
+
+    def delete(self, cursor, ids):
+        # Stay well below SQLite's bound parameter limit.
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', batch)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'ecom.search.DatabaseSearchBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def index_products(ids):
+    # Index what was committed; a rolled back write never reaches the index.
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: get_search_backend().index_products(ids))
+
+
+def remove_products(ids):
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: get_search_backend().remove_products(ids))
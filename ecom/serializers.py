@@ -1,14 +1,17 @@
+import json
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .instrumentation import TimedSerializerMixin, timed_serialization
+from .signals import products_changed
 from .models import Category, SubCategory, Product, Cart, Profile, NNotification, Wishlist, Shipping, ProductAtribute
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = ['image']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     image = serializers.CharField(max_length=100, source='profile.image')
     class Meta:
         model = User    
@@ -22,52 +25,92 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class SubCategorySerializer(serializers.ModelSerializer):
+class SubCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = SubCategory
         fields = '__all__'
 
 
-class CartSerializer(serializers.ModelSerializer):
+def check_attribute(product, attribute):
+    if attribute is not None and attribute.product_id != product.pk:
+        raise serializers.ValidationError({'attribute': ['This attribute belongs to another product.']})
+
+
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
     class Meta:
         model = Cart
-        fields = '__all__'
+        exclude = ['attribute_key']
+        # The unique constraint is over the generated attribute_key, which
+        # DRF can not validate; validate() checks the line instead.
+        validators = []
+
+    def validate(self, attrs):
+        line = {field: attrs.get(field, getattr(self.instance, field, None)) for field in ('user', 'product', 'attribute')}
+        check_attribute(line['product'], line['attribute'])
+        duplicates = Cart.objects.filter(**line)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError('This product is already in the cart.')
+        return attrs
+
+
+class CartItemSerializer(serializers.Serializer):
+    """Body of ``add_to_cart``; the product is ``context['product']``."""
+    attribute = serializers.PrimaryKeyRelatedField(queryset=ProductAtribute.objects.all(), required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, attrs):
+        check_attribute(self.context['product'], attrs.get('attribute'))
+        return attrs
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = NNotification
         fields = '__all__'
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Wishlist
         fields = '__all__'
 
-class ShippingSerializer(serializers.ModelSerializer):
+class ShippingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Shipping
         fields = '__all__'
 
 
-class ProductSizeSerializer(serializers.ModelSerializer):
+class ProductSizeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductAtribute
-        fields = ['attribute', 'name', 'quantity']
+        fields = ['name', 'value', 'quantity']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     attribute = ProductSizeSerializer(many=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'user', 'name', 'subcategory', 'price', 'description', 'image', 'status', 'quantity', 'attribute', 'discount', 'date']
+        fields = ['id', 'user', 'name', 'subcategory', 'price', 'description', 'image', 'status', 'quantity', 'attribute', 'discount', 'date', 'rating_average', 'rating_count', 'rating_histogram']
+        read_only_fields = ['rating_average', 'rating_count']
+
+    def validate_attribute(self, attributes):
+        # Nested fields are optional under partial=True, but update() matches
+        # attributes on (name, value).
+        for attribute in attributes:
+            if 'name' not in attribute or 'value' not in attribute:
+                raise serializers.ValidationError('Each attribute needs a name and a value.')
+        return attributes
 
     def create(self, validated_data):
         attribute_data = validated_data.pop('attribute')
@@ -83,11 +126,130 @@ class ProductSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
 
         if attributes_data:
+            # Attributes are matched on (name, value): listed ones get their
+            # quantity updated, new ones are added, with one query each.
+            existing = {(attribute.name, attribute.value): attribute for attribute in instance.attribute.all()}
+            changed, added = [], []
             for attribute_data in attributes_data:
-                attribute_obj, created = ProductAtribute.objects.update_or_create(
-                    product=instance,
-                    attribute=attribute_data.get('attribute'),
-                    defaults={'quantity': attribute_data.get('quantity')}
-                )
+                attribute = existing.get((attribute_data['name'], attribute_data['value']))
+                if attribute is None:
+                    added.append(ProductAtribute(product=instance, **attribute_data))
+                elif 'quantity' in attribute_data:
+                    attribute.quantity = attribute_data['quantity']
+                    changed.append(attribute)
+            ProductAtribute.objects.bulk_update(changed, ['quantity'])
+            ProductAtribute.objects.bulk_create(added)
+            products_changed.send(sender=ProductAtribute, ids=[instance.pk])
+            if hasattr(instance, '_prefetched_objects_cache'):
+                instance._prefetched_objects_cache.pop('attribute', None)
+
+        return instance
+
+
+class ProductBulkUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField()
+    price = serializers.FloatField(min_value=0, required=False)
+    discount = serializers.IntegerField(min_value=0, max_value=100, required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'price', 'discount', 'quantity', 'status']
+        extra_kwargs = {'status': {'required': False}}
 
-        return instance
\ No newline at end of file
+
+class ProductImportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Foreign keys are plain ids here; the importer resolves them once per
+    # chunk instead of letting PrimaryKeyRelatedField query for every row.
+    user = serializers.IntegerField(source='user_id')
+    subcategory = serializers.IntegerField(source='subcategory_id')
+    image = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    attribute = ProductSizeSerializer(many=True, required=False, default=list)
+
+    class Meta:
+        model = Product
+        fields = ['user', 'name', 'subcategory', 'price', 'description', 'image', 'status', 'quantity', 'attribute', 'discount']
+
+    def to_internal_value(self, data):
+        # CSV cells are strings, attributes come in as a JSON list.
+        attribute = data.get('attribute')
+        if isinstance(attribute, str):
+            data = dict(data)
+            try:
+                data['attribute'] = json.loads(attribute) if attribute.strip() else []
+            except ValueError:
+                raise serializers.ValidationError({'attribute': ['Invalid JSON.']})
+        return super().to_internal_value(data)
+
+
+class ProductRowSerializer:
+    """
+    Read-only twin of ``ProductSerializer`` for product lists: renders the
+    same representation from ``.values()`` rows and one flat attribute
+    query, skipping model instances and per-field serializer dispatch. Keep
+    it in step with ``ProductSerializer.Meta.fields``.
+    """
+    columns = [
+        'id', 'user_id', 'name', 'subcategory_id', 'price', 'description', 'image', 'status', 'quantity',
+        'discount', 'date', 'rating_average', 'rating_count', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5',
+    ]
+
+    def __init__(self, rows, attributes, context=None):
+        self.rows = rows
+        self.attributes = attributes
+        self.request = (context or {}).get('request')
+        self.storage = Product._meta.get_field('image').storage
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.select_related(None).prefetch_related(None).values(*cls.columns)
+
+    @staticmethod
+    def attribute_rows(ids):
+        return ProductAtribute.objects.filter(product_id__in=ids).order_by('pk').values_list('product_id', 'name', 'value', 'quantity')
+
+    @staticmethod
+    def group_attributes(rows):
+        attributes = {}
+        for product_id, name, value, quantity in rows:
+            attributes.setdefault(product_id, []).append({'name': name, 'value': value, 'quantity': quantity})
+        return attributes
+
+    @classmethod
+    def for_rows(cls, rows, context=None):
+        return cls(rows, cls.group_attributes(cls.attribute_rows([row['id'] for row in rows])), context)
+
+    @classmethod
+    async def afor_rows(cls, rows, context=None):
+        attributes = [row async for row in cls.attribute_rows([row['id'] for row in rows])]
+        return cls(rows, cls.group_attributes(attributes), context)
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    @property
+    @timed_serialization
+    def data(self):
+        return [
+            {
+                'id': row['id'],
+                'user': row['user_id'],
+                'name': row['name'],
+                'subcategory': row['subcategory_id'],
+                'price': row['price'],
+                'description': row['description'],
+                'image': self.image_url(row['image']),
+                'status': row['status'],
+                'quantity': row['quantity'],
+                'attribute': self.attributes.get(row['id'], []),
+                'discount': row['discount'],
+                'date': row['date'].isoformat(),
+                'rating_average': row['rating_average'],
+                'rating_count': row['rating_count'],
+                'rating_histogram': {str(stars): row[f'stars_{stars}'] for stars in range(1, 6)},
+            }
+            for row in self.rows
+        ]
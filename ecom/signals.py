@@ -1,62 +1,141 @@
-from django.db.models.signals import post_save
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import Signal, receiver
-from .models import Payment, Shipping, Product, Wishlist
-from notifications.signals import notify
+from django.utils import timezone
+from .models import Payment, Product, SubCategory, Category, ProductAtribute, Rating, NNotification
+from .ratings import unrate_product
+from .caching import TAXONOMY, bump_version, expire_products
+from .conditional import products_deleted
+from .pubsub import nnotification_event, notification_event, publish_on_commit
+from .facets import index_products as index_facets, remove_products as remove_facets
+from .search import index_products, remove_products
+from .tasks import enqueue_discount_notifications, enqueue_fulfilment
+from .unread import add_unread, invalidate, notified
+from swapper import load_model
 
 @receiver(post_save, sender=Payment)
-def notify_payment(sender, instance,created, **kwargs):
-        
-    product = instance.product
-    seller = product.user
-    customer = instance.user
-    notify.send(instance, recipient=seller, verb='you reached level 10',description=f'customer have successfully paid for {product.name}.')
-    notify.send(instance, recipient=customer, verb='you reached level 10',description=f'You have successfully paid for {product.name}.')
+def fulfil_payment(sender, instance, created, **kwargs):
+    # Notifications and the shipment are written by the job workers once
+    # the payment commits, not inside the checkout request.
+    if created:
+        enqueue_fulfilment([instance.pk])
 
-@receiver(post_save, sender=Payment)
-def quantity_control(sender, instance,created, **kwargs):
-        
-    product = instance.product
-    product.quantity=product.quantity - 1
-    product.save()
 
+@receiver(post_save, sender=NNotification)
+def count_nnotification(sender, instance, created, **kwargs):
+    if created and not instance.seen:
+        notified([instance.user_id])
+        publish_on_commit(instance.user_id, nnotification_event(instance))
+    elif not created:
+        invalidate([instance.user_id])
 
-@receiver(post_save, sender=Payment)
-def ship(sender, instance, created, **kwargs):
-    if created:
-        product = instance.product
-        customer = instance.user
 
-        Shipping.objects.create(
-            user=customer,
-            product=product,
-            address=customer.profile.address, 
-            city=customer.profile.city,       
-            country=customer.profile.country,  
-            status='pending'
-        )
+@receiver(post_delete, sender=NNotification)
+def uncount_nnotification(sender, instance, **kwargs):
+    if not instance.seen:
+        add_unread({instance.user_id: -1})
+
+
+@receiver(post_save, sender=load_model('notifications', 'Notification'))
+def count_notification(sender, instance, created, **kwargs):
+    if created and instance.unread:
+        notified([instance.recipient_id])
+        publish_on_commit(instance.recipient_id, notification_event(instance))
+    elif not created:
+        invalidate([instance.recipient_id])
+
+
+@receiver(post_delete, sender=load_model('notifications', 'Notification'))
+def uncount_notification(sender, instance, **kwargs):
+    invalidate([instance.recipient_id])
+
+
+# Sent with ids= by writes that bypass post_save, such as bulk_create.
+products_changed = Signal()
+
+
+@receiver(products_changed)
+def reindex_products(sender, ids, **kwargs):
+    index_products(ids)
+    index_facets(ids)
+    expire_products(ids)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    products_changed.send(sender=Product, ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    products_deleted()
+    remove_products([instance.pk])
+    remove_facets([instance.pk])
+    expire_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductAtribute)
+@receiver(post_delete, sender=ProductAtribute)
+def reindex_attribute(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        # Cascaded from deleting the product itself.
+        return
+    index_facets([instance.product_id])
+    expire_products([instance.product_id])
+    # Attributes are part of the product's representation.
+    Product.objects.filter(pk=instance.product_id).update(modified=timezone.now())
+
+
+@receiver(post_save, sender=SubCategory)
+def reindex_subcategory(sender, instance, created, **kwargs):
+    if not created:
+        reindex_taxonomy(sender, Product.objects.filter(subcategory=instance))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    if not created:
+        reindex_taxonomy(sender, Product.objects.filter(subcategory__category=instance))
+
+
+def reindex_taxonomy(sender, products):
+    # The names are part of the products' representation and facets, and
+    # other processes find changed products by ``modified``.
+    products.update(modified=timezone.now())
+    products_changed.send(sender=sender, ids=products.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def expire_taxonomy(sender, instance, **kwargs):
+    bump_version(TAXONOMY)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def expire_rated_product(sender, instance, **kwargs):
+    # The aggregates themselves move with queryset.update().
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).pk:
+        expire_products([instance.object_id])
+
 
+@receiver(post_delete, sender=Rating)
+def drop_rating(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).pk:
+        unrate_product(instance)
 
 
 @receiver(post_save, sender=Product)
-def notify_user_discount(sender,instance,validated_data, product_id, old_discount, new_discount, **kwargs):
-    try:
-        product = Product.objects.get(id=product_id)
-        wishlists = Wishlist.objects.filter(products__id=product_id)
-        old_discount = instance.discount
-        new_discount = validated_data.get('discount', instance.discount)
-
-        if old_discount and new_discount is not None:
-            if old_discount < new_discount:
-                for wishlist in wishlists:
-                    user = wishlist.user
-                    if user and product:
-                        notify.send(
-                            sender=product, 
-                            recipient=user, 
-                            verb='discount applied', 
-                            description=f'{product.name} discount has been applied. Old discount: {old_discount}, New discount: {new_discount}.'
-                        )
-    except Product.DoesNotExist:
-        pass
-    except Exception as e:
-        print(f'An error occurred')
\ No newline at end of file
+def notify_user_discount(sender, instance, created, **kwargs):
+    # Compare with the discount loaded from the database (Product.from_db);
+    # wishlisters are notified by background jobs, so the seller's save
+    # costs the same however many users wishlisted the product.
+    if created or not hasattr(instance, '_loaded_discount'):
+        return
+    old_discount, new_discount = instance._loaded_discount, instance.discount
+    if new_discount is None or (old_discount or 0) >= new_discount:
+        return
+    instance._loaded_discount = new_discount
+    enqueue_discount_notifications(instance.pk, old_discount or 0, new_discount)
@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .caching import expire_products
+from .models import Product, ProductAtribute, StockReservation
+
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', timedelta(minutes=15))
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def positive(quantity):
+    # A negative amount would pass the ``quantity >= n`` guards and restock.
+    if quantity <= 0:
+        raise ValueError(f'Stock moves take a positive quantity, not {quantity}.')
+
+
+def touched(model):
+    # queryset.update() skips auto_now fields; set them as save() would.
+    return {field.name: timezone.now() for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+
+
+def take_stock(product_id, quantity, attribute_id=None):
+    """
+    Decrements stock with guarded UPDATEs (``quantity >= n``), so concurrent
+    checkouts of the same SKU can never oversell or lose an update and only
+    the product (and attribute) rows are locked. A variant sale counts
+    against both the variant and the product total.
+    """
+    positive(quantity)
+    with transaction.atomic():
+        taken = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity, **touched(Product))
+        if not taken:
+            raise OutOfStock(f'Product {product_id} has fewer than {quantity} in stock.')
+        if attribute_id is not None:
+            taken = ProductAtribute.objects.filter(
+                pk=attribute_id, product_id=product_id, quantity__gte=quantity
+            ).update(quantity=F('quantity') - quantity)
+            if not taken:
+                raise OutOfStock(f'Attribute {attribute_id} has fewer than {quantity} in stock.')
+        expire_products([product_id])
+
+
+def take_stock_many(model, quantities, products=None):
+    """
+    ``take_stock`` for many rows of ``model`` in one statement: a CASE on
+    the primary key supplies each row's amount to both the guard and the
+    decrement. With ``products`` (pk -> product id) a row only matches
+    under its own product. Raises ``OutOfStock`` unless every row had
+    enough.
+    """
+    if not quantities:
+        return
+    for quantity in quantities.values():
+        positive(quantity)
+    owner = (lambda pk: {'product_id': products[pk]}) if products is not None else (lambda pk: {})
+    amount = Case(*[When(pk=pk, then=Value(quantity), **owner(pk)) for pk, quantity in quantities.items()], output_field=IntegerField())
+    with transaction.atomic():
+        taken = model.objects.filter(pk__in=list(quantities), quantity__gte=amount).update(quantity=F('quantity') - amount, **touched(model))
+        if taken != len(quantities):
+            raise OutOfStock('Some items are no longer in stock in the requested quantity.')
+
+
+def put_back(product_id, quantity, attribute_id=None):
+    positive(quantity)
+    Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity, **touched(Product))
+    if attribute_id is not None:
+        ProductAtribute.objects.filter(pk=attribute_id).update(quantity=F('quantity') + quantity)
+    expire_products([product_id])
+
+
+@transaction.atomic
+def reserve(user, product, quantity=1, attribute=None, ttl=None):
+    """
+    Holds ``quantity`` units for ``user`` until the reservation expires or
+    is sold. Raises ``OutOfStock`` when the units are not available.
+    """
+    take_stock(product.pk, quantity, attribute.pk if attribute else None)
+    return StockReservation.objects.create(
+        user=user,
+        product=product,
+        attribute=attribute,
+        quantity=quantity,
+        expires_at=timezone.now() + (ttl or RESERVATION_TTL),
+    )
+
+
+@transaction.atomic
+def release(reservation):
+    # Only the caller that flips held -> released gives the stock back.
+    released = StockReservation.objects.filter(pk=reservation.pk, status='held').update(status='released')
+    if released:
+        put_back(reservation.product_id, reservation.quantity, reservation.attribute_id)
+    return bool(released)
+
+
+def release_expired(now=None):
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status='held', expires_at__lte=now).order_by('pk')
+    released = 0
+    while True:
+        # Released rows drop out of the filter, so re-query the head each time.
+        batch = list(expired.only('pk', 'product_id', 'attribute_id', 'quantity')[:500])
+        if not batch:
+            return released
+        released += sum(release(reservation) for reservation in batch)
+
+
+@transaction.atomic
+def sell(user, product, quantity=1, attribute=None):
+    """
+    Settles a sale of ``quantity`` units: converts the user's live
+    reservation for this product/variant when there is one, otherwise takes
+    the stock directly. Returns the converted reservation or ``None``.
+    Raises ``OutOfStock`` when the units are not available.
+    """
+    attribute_id = attribute.pk if attribute else None
+    reservation = StockReservation.objects.filter(
+        user=user, product=product, attribute_id=attribute_id, status='held',
+        quantity=quantity, expires_at__gt=timezone.now(),
+    ).first()
+    if reservation is not None:
+        converted = StockReservation.objects.filter(pk=reservation.pk, status='held').update(status='sold')
+        if converted:
+            reservation.status = 'sold'
+            return reservation
+    take_stock(product.pk, quantity, attribute_id)
+    return None
+
+
+@transaction.atomic
+def sell_many(user, lines):
+    """
+    ``sell`` for a whole order. ``lines`` are ``(product_id, attribute_id,
+    quantity)`` tuples; returns the reservation converted for each line (or
+    ``None``). Live reservations are converted with one UPDATE and all the
+    remaining stock is taken with one UPDATE per table.
+    """
+    held = defaultdict(list)
+    reservations = StockReservation.objects.select_for_update().filter(
+        user=user, status='held', expires_at__gt=timezone.now(),
+        product_id__in={product_id for product_id, _, _ in lines},
+    )
+    for reservation in reservations:
+        held[reservation.product_id, reservation.attribute_id, reservation.quantity].append(reservation)
+
+    converted = [held[line].pop() if held[line] else None for line in lines]
+    StockReservation.objects.filter(pk__in=[r.pk for r in converted if r]).update(status='sold')
+    for reservation in converted:
+        if reservation is not None:
+            reservation.status = 'sold'
+
+    products, attributes, owners = defaultdict(int), defaultdict(int), {}
+    for (product_id, attribute_id, quantity), reservation in zip(lines, converted):
+        if reservation is None:
+            products[product_id] += quantity
+            if attribute_id is not None:
+                attributes[attribute_id] += quantity
+                if owners.setdefault(attribute_id, product_id) != product_id:
+                    raise ValueError(f'Attribute {attribute_id} does not belong to product {product_id}.')
+    take_stock_many(Product, products)
+    take_stock_many(ProductAtribute, attributes, owners)
+    expire_products(products)
+    return converted
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from swapper import load_model
+
+from .models import NNotification
+from .pubsub import get_broker, nnotification_event, notification_event, user_channel
+
+
+# How long a stream waits on the broker before re-reading the inbox from the
+# database. Notifications published in another process (the job workers)
+# arrive at most this late; the heartbeat also keeps proxies from closing
+# idle connections.
+STREAM_RESYNC_INTERVAL = getattr(settings, 'NOTIFICATION_STREAM_RESYNC_INTERVAL', 15)
+STREAM_BATCH_SIZE = 100
+
+
+def parse_cursor(value):
+    """
+    Stream cursors are ``<notification id>-<nnotification id>``, the last
+    row of each inbox the client has seen; sent back as the event id so a
+    reconnecting EventSource resumes through ``Last-Event-ID``.
+    """
+    try:
+        notification_id, nnotification_id = value.split('-')
+        return [int(notification_id), int(nnotification_id)]
+    except (AttributeError, ValueError):
+        return None
+
+
+async def latest_cursor(user_id):
+    Notification = load_model('notifications', 'Notification')
+    notifications = await Notification.objects.filter(recipient_id=user_id).aaggregate(last=Max('pk'))
+    nnotifications = await NNotification.objects.filter(user_id=user_id).aaggregate(last=Max('pk'))
+    return [notifications['last'] or 0, nnotifications['last'] or 0]
+
+
+@sync_to_async
+def missed_events(user_id, cursor):
+    Notification = load_model('notifications', 'Notification')
+    notifications = Notification.objects.filter(recipient_id=user_id, pk__gt=cursor[0]).order_by('pk')
+    nnotifications = NNotification.objects.filter(user_id=user_id, pk__gt=cursor[1]).order_by('pk')
+    try:
+        events = [notification_event(n) for n in notifications[:STREAM_BATCH_SIZE]]
+        events += [nnotification_event(n) for n in nnotifications[:STREAM_BATCH_SIZE]]
+        return events
+    finally:
+        # A stream stays open for hours and reads every resync interval:
+        # it holds no connection while it waits.
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def advance(cursor, event):
+    # Returns False for events the client already has.
+    position = 0 if event['type'] == 'notification' else 1
+    if event['id'] <= cursor[position]:
+        return False
+    cursor[position] = event['id']
+    return True
+
+
+def format_event(cursor, event):
+    return f'id: {cursor[0]}-{cursor[1]}\nevent: {event["type"]}\ndata: {json.dumps(event)}\n\n'
+
+
+async def event_stream(user_id, cursor, resync_interval=None):
+    """
+    Server-sent events for ``user_id``'s notifications after ``cursor``.
+
+    A published message only wakes the stream up; the events themselves are
+    read from the database after the cursor, so rows created by other
+    processes or dropped by a full queue are never skipped. Subscribing
+    before the first read means nothing committed in between is missed.
+    """
+    resync_interval = resync_interval or STREAM_RESYNC_INTERVAL
+    async with get_broker().subscribe(user_channel(user_id)) as queue:
+        yield f'retry: {int(resync_interval * 1000)}\n\n'
+        while True:
+            sent = False
+            for event in await missed_events(user_id, cursor):
+                if advance(cursor, event):
+                    sent = True
+                    yield format_event(cursor, event)
+            if not sent:
+                yield ': keepalive\n\n'
+            try:
+                await asyncio.wait_for(queue.get(), resync_interval)
+            except asyncio.TimeoutError:
+                continue
+            while not queue.empty():
+                queue.get_nowait()
@@ -0,0 +1,77 @@
+import logging
+
+from django.conf import settings
+
+from .analytics import record_sales
+from .fanout import bulk_notify, notification, payment_notifications
+from .jobs import enqueue, idempotency_key, task
+from .models import Payment, Product, Profile, Shipping, Wishlist
+
+
+logger = logging.getLogger(__name__)
+
+DISCOUNT_FANOUT_CHUNK = getattr(settings, 'DISCOUNT_FANOUT_CHUNK', 1000)
+
+
+@task()
+def notify_payments(payments):
+    payments = Payment.objects.filter(pk__in=payments).select_related('product')
+    bulk_notify([notification for payment in payments for notification in payment_notifications(payment)])
+
+
+@task()
+def ship_payments(payments):
+    payments = list(Payment.objects.filter(pk__in=payments).select_related('product'))
+    profiles = {profile.user_id: profile for profile in Profile.objects.filter(user__in={payment.user_id for payment in payments})}
+    # Checkout requires a profile, but it may have been deleted since: ship
+    # the rest of the batch rather than fail it on every retry.
+    missing = [payment.pk for payment in payments if payment.user_id not in profiles]
+    if missing:
+        logger.warning('Not shipping payments %s: their users have no profile', missing)
+    Shipping.objects.bulk_create([
+        Shipping(
+            user_id=payment.user_id,
+            product=payment.product,
+            address=profiles[payment.user_id].address,
+            city=profiles[payment.user_id].city,
+            country=profiles[payment.user_id].country,
+            status='pending',
+        )
+        for payment in payments if payment.user_id in profiles
+    ])
+
+
+@task()
+def roll_up_payments(payments):
+    record_sales(payments)
+
+
+def enqueue_fulfilment(payments):
+    payments = sorted(payments)
+    enqueue('notify_payments', {'payments': payments}, key=idempotency_key('notify_payments', *payments))
+    enqueue('ship_payments', {'payments': payments}, key=idempotency_key('ship_payments', *payments))
+    enqueue('roll_up_payments', {'payments': payments}, key=idempotency_key('roll_up_payments', *payments))
+
+
+@task()
+def notify_discount(product, old_discount, new_discount, after=0):
+    """
+    Notifies one chunk of the product's wishlisters (by ascending user id)
+    and queues the next chunk, so every job stays small however popular
+    the product is.
+    """
+    product = Product.objects.filter(pk=product).only('pk', 'name').first()
+    if product is None:
+        return
+    users = list(
+        Wishlist.objects.filter(product=product, user_id__gt=after)
+        .order_by('user_id').values_list('user_id', flat=True).distinct()[:DISCOUNT_FANOUT_CHUNK]
+    )
+    description = f'{product.name} discount has been applied. Old discount: {old_discount}, New discount: {new_discount}.'
+    bulk_notify([notification(user_id, product, 'discount applied', description) for user_id in users])
+    if len(users) == DISCOUNT_FANOUT_CHUNK:
+        enqueue_discount_notifications(product.pk, old_discount, new_discount, after=users[-1])
+
+
+def enqueue_discount_notifications(product, old_discount, new_discount, after=0):
+    enqueue('notify_discount', {'product': product, 'old_discount': old_discount, 'new_discount': new_discount, 'after': after})
@@ -0,0 +1,73 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from swapper import load_model
+
+from .models import NNotification, UnreadCounter
+
+
+# Writes that bypass the counter (e.g. django-notifications-hq's own
+# mark-as-read views use queryset.update()) are corrected by a recount once
+# the counter is this old.
+UNREAD_COUNTER_TTL = getattr(settings, 'UNREAD_COUNTER_TTL', timedelta(minutes=5))
+
+
+def count_unread(user_id):
+    Notification = load_model('notifications', 'Notification')
+    inbox = Notification.objects.filter(recipient_id=user_id, unread=True)
+    if getattr(settings, 'DJANGO_NOTIFICATIONS_CONFIG', {}).get('SOFT_DELETE'):
+        inbox = inbox.filter(deleted=False)
+    return NNotification.objects.filter(user_id=user_id, seen=False).count() + inbox.count()
+
+
+def unread_count(user_id):
+    counter = UnreadCounter.objects.filter(pk=user_id).first()
+    if counter is not None and counter.reconciled_at and counter.reconciled_at > timezone.now() - UNREAD_COUNTER_TTL:
+        return counter.unread
+    unread = count_unread(user_id)
+    UnreadCounter.objects.update_or_create(pk=user_id, defaults={'unread': unread, 'reconciled_at': timezone.now()})
+    return unread
+
+
+def add_unread(deltas):
+    """
+    Moves the counters of ``{user id: delta}``, one UPDATE per distinct
+    delta. Users without a counter yet are skipped; they get counted on
+    their first read.
+    """
+    users = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            users[delta].append(user_id)
+    for delta, user_ids in users.items():
+        UnreadCounter.objects.filter(pk__in=user_ids).update(unread=F('unread') + delta)
+
+
+def notified(recipient_ids):
+    add_unread(Counter(recipient_ids))
+
+
+def invalidate(user_ids):
+    UnreadCounter.objects.filter(pk__in=list(user_ids)).update(reconciled_at=None)
+
+
+def mark_read(user_id, ids=None):
+    """
+    Marks the user's NNotifications ``ids`` (all of them, and the
+    django-notifications-hq inbox too, when ``ids`` is None) as read with
+    one UPDATE per table. Returns the number of rows marked.
+    """
+    marked = NNotification.objects.filter(user_id=user_id, seen=False)
+    if ids is not None:
+        marked = marked.filter(pk__in=ids)
+    count = marked.update(seen=True)
+    if ids is None:
+        Notification = load_model('notifications', 'Notification')
+        count += Notification.objects.filter(recipient_id=user_id, unread=True).update(unread=False)
+        UnreadCounter.objects.update_or_create(pk=user_id, defaults={'unread': 0, 'reconciled_at': timezone.now()})
+    else:
+        add_unread({user_id: -count})
+    return count
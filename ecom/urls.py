@@ -1,6 +1,6 @@
 from django.urls import path, include, re_path
 import notifications.urls
-from . import views
+from . import instrumentation, views
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -21,6 +21,9 @@ router.register('shiping', views.ShippingApi)
 
 
 urlpatterns = [
+    # Ahead of the router, which would take "stream" for a notification pk.
+    # The stream itself is in ecom.async_urls.
+    path('nnotifications/stream/', views.notification_stream_unavailable, name='notification_stream'),
     path('', include(router.urls)),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -29,5 +32,6 @@ urlpatterns = [
     re_path(r'^inbox/notifications/', include((notifications.urls, 'notifications'), namespace='notifications')),
     path('csv/', views.CSVUploadView.as_view()),
     path('csv_export/', views.CSVExportView.as_view()),
+    path('metrics', instrumentation.metrics, name='metrics'),
 
 ]
\ No newline at end of file
@@ -1,19 +1,36 @@
 from django.db import transaction
+from django.db.models import F, Prefetch
 from rest_framework.response import Response
-from rest_framework import  viewsets
-from .models import  SubCategory, Product, Rating, Cart, Payment, Category, NNotification, PaymentMethod, Wishlist, Shipping
-from .serializers import SubCategorySerializer, ProductSerializer, CartSerializer, CategorySerializer, UserSerializer, NotificationSerializer, WishlistSerializer, ShippingSerializer
+from rest_framework import  mixins, viewsets
+from .models import  SubCategory, Product, Cart, Payment, Category, NNotification, PaymentMethod, Profile, Wishlist, Shipping, StockReservation
+from .analytics import METRICS, date_range, sales_series, top_products
+from .bulk import PRODUCT_BULK_LIMIT, create_products, delete_products, update_products
+from .caching import TAXONOMY, CachedResponseMixin, body_etag, json_response, not_modified, product_cache, request_variant
+from .checkout import CheckoutError, checkout
+from .conditional import ConditionalGetMixin, catalog_validators
+from .exporters import ProductCSVExporter
+from .facets import bitmap, facet_index
+from .filters import ProductFacetFilter
+from .importers import ProductCSVImporter
+from .pagination import ProductPagination, NotificationPagination, StandardPageNumberPagination
+from .ratings import rate_product
+from .replicas import ReplicaReadsMixin
+from .search import get_search_backend
+from .authentication import authenticate
+from .streams import event_stream, latest_cursor, parse_cursor
+from .stock import OutOfStock, release, reserve, sell, touched
+from .unread import mark_read, unread_count
+from .serializers import SubCategorySerializer, ProductSerializer, ProductRowSerializer, CartSerializer, CartItemSerializer, CategorySerializer, UserSerializer, NotificationSerializer, WishlistSerializer, ShippingSerializer
 from rest_framework.decorators import action
-from django.contrib.contenttypes.models import ContentType
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from notifications.signals import notify
-from rest_framework.generics import ListAPIView
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.parsers import MultiPartParser, FormParser
 import csv
-from django.http import HttpResponse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
 
 
 
@@ -26,84 +43,182 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadsMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_namespace = TAXONOMY
 
 
-class SubCategoryViewSet(viewsets.ModelViewSet):
-    queryset = SubCategory.objects.all().prefetch_related('category')
+class SubCategoryViewSet(ReplicaReadsMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = SubCategory.objects.all().select_related('category')
     serializer_class = SubCategorySerializer
+    cache_namespace = TAXONOMY
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().prefetch_related('sub_category')
+class ProductViewSet(ReplicaReadsMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('subcategory__category', 'user').prefetch_related(Prefetch('attribute'))
     serializer_class = ProductSerializer
+    pagination_class = ProductPagination
+    filter_backends = [ProductFacetFilter]
+
+    def list_validators(self):
+        # The facet counts cover the whole catalog, not just the filtered rows.
+        return catalog_validators()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.list_products, *self.list_validators(), *args, **kwargs)
+
+    def list_products(self, request, *args, **kwargs):
+        rows = self.paginate_queryset(ProductRowSerializer.values(self.filter_queryset(self.get_queryset())))
+        serializer = ProductRowSerializer.for_rows(rows, self.get_serializer_context())
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = facet_index.counts(ProductFacetFilter.get_selection(request))
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        # Served from the product response cache; see ecom.caching.
+        pk = kwargs[self.lookup_field]
+        if request.accepted_renderer.format != 'json' or not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        def render():
+            # Straight to the serializer: the ETag is a hash of the body.
+            response = mixins.RetrieveModelMixin.retrieve(self, request, *args, **kwargs)
+            return request.accepted_renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+
+        _, body = product_cache.get(int(pk), request_variant(request), render)
+        tag = body_etag(body)
+        if not_modified(request, tag):
+            return HttpResponseNotModified(headers={'ETag': tag})
+        return json_response(body, tag)
 
     @transaction.atomic
     @action(detail=True, methods=['post'], url_name='add_rating', url_path='add_rating')
     def add_rating(self, request, pk):
-        rating = Rating.objects.create(
-            user=request.user,
-            stars=request.data.get('stars'),
-            content_type=ContentType.objects.get_for_model(self.get_object()),
-            object_id=pk
-        )
+        try:
+            stars = int(request.data.get('stars'))
+        except (TypeError, ValueError):
+            stars = None
+        if stars not in range(1, 6):
+            return Response({'error': 'stars must be an integer from 1 to 5.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rating, created = rate_product(request.user, self.get_object(), stars)
+        if not created:
+            return Response({'success': 'Rating updated successfully.'}, status=status.HTTP_200_OK)
         return Response({'success': 'Rating added successfully.'}, status=status.HTTP_201_CREATED)
 
     @transaction.atomic
     @action(detail=True, methods=['post'], url_name='add_to_wishlist', url_path='add_to_wishlist')
     def add_to_wishlist(self, request, pk):
-    
-        instance = self.get_object()
-        wishlist = Wishlist(
-            user=request.user,
-            product=instance,
-        )
-        
-        try:
-            wishlist.save()
-        except Exception as e:
-            return Response({'error': f'An error occurred while adding the product to your wishlist'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+        # One entry per product: adding it again is a no-op.
+        _, created = Wishlist.objects.get_or_create(user=request.user, product=self.get_object())
+        if not created:
+            return Response({'success': 'Product is already in your wishlist.'}, status=status.HTTP_200_OK)
         return Response({'success': 'Product added successfully.'}, status=status.HTTP_201_CREATED)
-    
 
     @transaction.atomic
     @action(detail=True, methods=['post'], url_name='add_to_cart', url_path='add_to_cart')
     def add_to_cart(self, request, pk):
-    
         instance = self.get_object()
-        cart = Cart(
-            user=request.user,
-            product=instance,
-            object_id=instance.pk
+        item = CartItemSerializer(data=request.data, context={'product': instance})
+        if not item.is_valid():
+            return Response(item.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # One line per product and attribute: adding it again adds to the
+        # line's quantity.
+        quantity = item.validated_data['quantity']
+        cart, created = Cart.objects.get_or_create(
+            user=request.user, product=instance, attribute=item.validated_data.get('attribute'),
+            defaults={'quantity': quantity},
         )
-        
-        try:
-            cart.save()
-        except Exception as e:
-            return Response({'error': f'An error occurred while adding the product to your cart: {str(e)}'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+        if not created:
+            Cart.objects.filter(pk=cart.pk).update(quantity=F('quantity') + quantity, **touched(Cart))
+            return Response({'success': 'Cart updated successfully.'}, status=status.HTTP_200_OK)
         return Response({'success': 'Product added successfully.'}, status=status.HTTP_201_CREATED)
-    
-
-
-
 
     @action(detail=True, methods=['get'], url_path='dashboard', url_name='dashboard')
     def dashboard(self, request, pk=None):
         try:
-            products = Product.objects.filter(user=request.user)
-            serializer = ProductSerializer(products, many=True)
+            products = self.get_queryset().filter(user=request.user)
+            serializer = self.get_serializer(products, many=True)
             return Response(serializer.data)
         except Exception as e:
             return Response({'error': f'An error occurred'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-
-class CartViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='dashboard/sales', url_name='dashboard-sales', permission_classes=[IsAuthenticated])
+    def sales(self, request):
+        """
+        Daily revenue, units and orders of the seller (or of one of their
+        products with ``?product=``) between ``date_from`` and ``date_to``,
+        read from the daily rollups.
+        """
+        try:
+            start, end = self.dashboard_range(request)
+            product = request.query_params.get('product')
+            product = int(product) if product else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        series = sales_series(request.user, start, end, product=product)
+        totals = {metric: sum(day[metric] for day in series) for metric in METRICS}
+        return Response({'date_from': start, 'date_to': end, 'totals': totals, 'series': series})
+
+    @action(detail=False, methods=['get'], url_path='dashboard/top', url_name='dashboard-top', permission_classes=[IsAuthenticated])
+    def top(self, request):
+        try:
+            start, end = self.dashboard_range(request)
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+            products = top_products(request.user, start, end, by=request.query_params.get('by', 'revenue'), limit=limit)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'date_from': start, 'date_to': end, 'results': products})
+
+    def dashboard_range(self, request):
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            value = request.query_params.get(name)
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+        return date_range(**dates)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_name='bulk', url_path='bulk', permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """
+        POST a list of products to create, PATCH a list of ``{id, price,
+        discount, quantity, status}`` changes, or DELETE ``{"ids": [...]}``,
+        for the seller's own products. Valid items are applied in one
+        transaction and each gets its own result.
+        """
+        if request.method == 'DELETE':
+            ids = request.data.get('ids') if isinstance(request.data, dict) else None
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                return Response({'error': 'ids must be a list of product ids.'}, status=status.HTTP_400_BAD_REQUEST)
+            items = ids
+        else:
+            items = request.data
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return Response({'error': 'Send a list of products.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > PRODUCT_BULK_LIMIT:
+            return Response({'error': f'At most {PRODUCT_BULK_LIMIT} products per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'POST':
+            results, done = create_products(request.user, items), status.HTTP_201_CREATED
+        elif request.method == 'PATCH':
+            results, done = update_products(request.user, items), status.HTTP_200_OK
+        else:
+            results, done = delete_products(request.user, items), status.HTTP_200_OK
+        failed = sum('errors' in result for result in results)
+        if failed and failed == len(results):
+            return Response({'status': 'failed', 'succeeded': 0, 'failed': failed, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'status': 'partial' if failed else 'success',
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'results': results,
+        }, status=done)
+
+
+class CartViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all().prefetch_related('product', 'user')
     serializer_class = CartSerializer
 
@@ -115,18 +230,30 @@ class CartViewSet(viewsets.ModelViewSet):
     def pay(self, request, pk):
         
         instance = self.get_object()
-        
+        # Locked and read again, so of two payments for the line the second
+        # finds it gone.
+        instance = get_object_or_404(Cart.objects.select_related('product', 'attribute').select_for_update(of=('self',)), pk=instance.pk)
 
         user = request.user
 
         if user != instance.user:
             return Response({'error': 'You are not authorized to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+        if not Profile.objects.filter(user=user).exists():
+            return Response({'error': 'Add a shipping address to your profile first.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        units = instance.quantity or 1
+        try:
+            reservation = sell(user, instance.product, units, attribute=instance.attribute)
+        except OutOfStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         payment = Payment(
             user=user,
             product=instance.product,
             unit_price=instance.product.price,
-            amount=instance.product.price,
+            amount=instance.product.price * units,
             method=PaymentMethod.objects.get(name='visa'),
         )
         
@@ -136,32 +263,137 @@ class CartViewSet(viewsets.ModelViewSet):
 
             return Response({'error': f'An error occurred while saving the payment ({str(e)})'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        try:
-            instance.delete()
-        except Exception as e:
-            return Response({'error': f'An error occurred while deleting the product'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if reservation is not None:
+            StockReservation.objects.filter(pk=reservation.pk).update(payment=payment)
+
+        deleted, _ = Cart.objects.filter(pk=instance.pk).delete()
+        if not deleted:
+            transaction.set_rollback(True)
+            return Response({'error': 'This cart line has already been paid for.'}, status=status.HTTP_409_CONFLICT)
 
         return Response({'success': 'Payment successful.'}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'], url_name='checkout', url_path='checkout')
+    def checkout_cart(self, request):
+        try:
+            payments = checkout(request.user, method=request.data.get('method', 'visa'))
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OutOfStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'success': 'Payment successful.',
+            'payments': [payment.pk for payment in payments],
+            'total': sum(payment.amount for payment in payments),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_name='reserve', url_path='reserve')
+    def reserve_stock(self, request, pk):
+        instance = self.get_object()
+        try:
+            reservation = reserve(request.user, instance.product, instance.quantity or 1, attribute=instance.attribute)
+        except OutOfStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'reservation': reservation.pk, 'expires_at': reservation.expires_at}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_name='release', url_path='release')
+    def release_stock(self, request, pk):
+        instance = self.get_object()
+        reservations = StockReservation.objects.filter(
+            user=request.user, product=instance.product, attribute=instance.attribute, status='held'
+        )
+        released = sum(release(reservation) for reservation in reservations)
+        return Response({'released': released}, status=status.HTTP_200_OK)
+
 
 class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     queryset = NNotification.objects.all()
+    pagination_class = NotificationPagination
 
 
     def get_queryset(self):
         return NNotification.objects.filter(user=self.request.user)
-    
+
+    @action(detail=False, methods=['get'], url_name='unread_count', url_path='unread_count')
+    def unread_badge(self, request):
+        return Response({'unread': unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'], url_name='mark_read', url_path='mark_read')
+    def mark_selected_read(self, request):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({'error': 'ids must be a list of notification ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        marked = mark_read(request.user.pk, ids)
+        return Response({'marked': marked, 'unread': unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'], url_name='mark_all_read', url_path='mark_all_read')
+    def mark_all_read(self, request):
+        return Response({'marked': mark_read(request.user.pk), 'unread': 0})
+
+
+async def notification_stream(request):
+    """
+    Pushes the user's new notifications as server-sent events over one idle
+    connection instead of having clients poll ``/nnotifications/``. Served
+    by the ASGI application only, see ``notification_stream_unavailable``.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    cursor = parse_cursor(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    if cursor is None:
+        cursor = await latest_cursor(user.pk)
+    response = StreamingHttpResponse(event_stream(user.pk, cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def notification_stream_unavailable(request):
+    # Under WSGI, Django collects an async streaming body in full before
+    # sending it, and the stream never ends.
+    return JsonResponse(
+        {'error': 'Notification streams need the ASGI application; poll /nnotifications/ instead.'},
+        status=status.HTTP_501_NOT_IMPLEMENTED,
+    )
 
     
-class SearchProducts(ListAPIView):
-    queryset = Product.objects.all()
+class SearchProducts(ReplicaReadsMixin, ListAPIView):
+    queryset = ProductViewSet.queryset
     serializer_class = ProductSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['name', 'description', 'category__name', 'sub_category__name', 'price', 'rating__stars']
-
-
-class WishListApi(viewsets.ModelViewSet):
+    pagination_class = ProductPagination
+    filter_backends = [ProductFacetFilter]
+    search_param = 'search'
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get(self.search_param, '').strip()
+        selection = ProductFacetFilter.get_selection(request)
+        if not query:
+            response = super().list(request, *args, **kwargs)
+            response.data['facets'] = facet_index.counts(selection)
+            return response
+
+        # Ranked ids come from the search index; facet filters narrow them
+        # and only the requested page is loaded from the database.
+        hits = get_search_backend().search(query)
+        ranked = hits
+        if selection:
+            matching = set(self.filter_queryset(self.get_queryset()).filter(pk__in=hits).values_list('pk', flat=True))
+            ranked = [pk for pk in hits if pk in matching]
+
+        paginator = StandardPageNumberPagination()
+        ids = paginator.paginate_queryset(ranked, request, view=self)
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([products[pk] for pk in ids if pk in products], many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['facets'] = facet_index.counts(selection, within=bitmap(hits))
+        return response
+
+
+class WishListApi(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Wishlist.objects.all()
     serializer_class = WishlistSerializer
 
@@ -169,7 +401,7 @@ class WishListApi(viewsets.ModelViewSet):
         return Wishlist.objects.filter(user=self.request.user)
 
 
-class ShippingApi(viewsets.ModelViewSet):
+class ShippingApi(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Shipping.objects.all()
     serializer_class = ShippingSerializer
 
@@ -183,29 +415,56 @@ class CSVUploadView(APIView):
         if not file_obj.name.endswith('.csv'):
             return Response({"error": "File is not a CSV"}, status=status.HTTP_400_BAD_REQUEST)
 
-        decoded_file = file_obj.read().decode('utf-8').splitlines()
-        reader = csv.DictReader(decoded_file)
-
-        for row in reader:
-            serializer = ProductSerializer(data=row)
-            if serializer.is_valid():
-                serializer.save()
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = ProductCSVImporter().run(file_obj)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return Response({"error": f"Could not read the CSV file ({str(e)})"}, status=status.HTTP_400_BAD_REQUEST)
+        if result['errors'] and not result['created']:
+            return Response({"status": "failed", **result}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"status": "success"}, status=status.HTTP_201_CREATED)
+        return Response({"status": "success" if not result['errors'] else "partial", **result}, status=status.HTTP_201_CREATED)
     
 
-class CSVExportView(APIView):
+class CSVExportView(ReplicaReadsMixin, APIView):
     def get(self, request, *args, **kwargs):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="data_export.csv"'
-
-        writer = csv.writer(response)
-        
-        writer.writerow(['User Name', 'Product name', 'subcategory','price', 'status', 'quantity'])
-        
-        for field in Product.objects.all():
-            writer.writerow([field.user, field.name, field.subcategory, field.price, field.status, field.quantity])
-        
-        return response
\ No newline at end of file
+        try:
+            filters = {
+                'seller': self.int_param(request, 'seller'),
+                'subcategory': self.int_param(request, 'subcategory'),
+                'date_from': self.date_param(request, 'date_from'),
+                'date_to': self.date_param(request, 'date_to'),
+            }
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The response streams after the view has returned.
+        exporter = ProductCSVExporter(Product.objects.using(self.read_database)).filter(**filters)
+
+        if request.query_params.get('gzip') in ('1', 'true'):
+            response = StreamingHttpResponse(exporter.stream_gzip(), content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="data_export.csv.gz"'
+        else:
+            response = StreamingHttpResponse(exporter.stream(), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="data_export.csv"'
+        return response
+
+    def int_param(self, request, name):
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f'{name} must be an integer')
+
+    def date_param(self, request, name):
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+        return date
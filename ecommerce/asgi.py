@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'ecommerce.asgi_urls')
+# Async requests don't reuse a thread's connection, so persistent ones would
+# only pile up; put a pooler (or DB_POOL_SIZE) in front instead.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
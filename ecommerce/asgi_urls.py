@@ -0,0 +1,11 @@
+"""
+URL configuration for the ASGI application: the async read views of
+ecom.async_urls in front of the regular routes.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('', include('ecom.async_urls')),
+] + sync_urlpatterns
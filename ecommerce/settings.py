@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from .database import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,17 +51,27 @@ INSTALLED_APPS = [
 
 ]
 
+# /metrics is served to staff users, to scrapers sending "Authorization:
+# Bearer $METRICS_TOKEN" and to the comma-separated METRICS_ALLOWED_IPS.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
 MIDDLEWARE = [
+    # Per-route latency, SQL and serialization metrics, served on /metrics.
+    'ecom.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Sends a user's reads to the primary for a while after they write.
+    'ecom.replicas.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'ecommerce.urls'
+# ecommerce/asgi.py switches to the URLconf with the async read views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'ecommerce.urls')
 
 TEMPLATES = [
     {
@@ -82,13 +95,57 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DATABASE_URL picks the backend (see ecommerce/database.py); SQLite in WAL
+# mode in db.sqlite3 by default. Connections persist for DB_CONN_MAX_AGE
+# seconds and are health checked before reuse; DB_POOL_SIZE pools them
+# instead where the backend supports it.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(
+        os.environ.get('DATABASE_URL') or f'sqlite:///{BASE_DIR / "db.sqlite3"}',
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        health_checks=os.environ.get('DB_HEALTH_CHECKS', '1') != '0',
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 0)) or None,
+    )
 }
 
+# Read replicas for the catalog read paths, see ecom/replicas.py. For a local
+# try-out, DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 with a copy of
+# db.sqlite3 stands in for one.
+DATABASES.update(replica_configs(
+    os.environ.get('DATABASE_REPLICA_URLS', ''),
+    conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+    health_checks=DATABASES['default']['CONN_HEALTH_CHECKS'],
+))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['ecom.replicas.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 2))
+
+
+# Local memory by default (per process). Set CACHE_DIR to share the response
+# caches between the processes of one host through the file-based backend.
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Product detail bodies: an in-process LRU, plus the named cache as a tier
+# shared by all processes when PRODUCT_CACHE_SHARED is set (e.g. 'default'
+# with the file-based backend).
+PRODUCT_CACHE_SIZE = 1000
+PRODUCT_CACHE_TTL = 30
+PRODUCT_CACHE_SHARED = os.environ.get('PRODUCT_CACHE_SHARED') or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -141,6 +198,13 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # JSON rendering counts towards the serialization time in /metrics.
+    'DEFAULT_RENDERER_CLASSES': [
+        'ecom.instrumentation.InstrumentedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'ecom.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
     # 'DEFAULT_PERMISSION_CLASSES':[
     #     'rest_framework.permissions.IsAuthenticated',
     # ]
@@ -148,6 +212,16 @@ REST_FRAMEWORK = {
 }
 
 
+# Ranked product search used by /search/, see ecom/search.py. The FTS5 index
+# only exists on SQLite; other databases query the catalog directly, which
+# every worker shares. The per-process InMemorySearchBackend suits a single
+# process only and has to be asked for.
+PRODUCT_SEARCH_BACKEND = os.environ.get('PRODUCT_SEARCH_BACKEND') or (
+    'ecom.search.SQLiteFTS5SearchBackend' if DATABASES['default']['ENGINE'] == 'ecommerce.sqlite3'
+    else 'ecom.search.DatabaseSearchBackend'
+)
+
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -0,0 +1,34 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite tuned for a single node serving concurrent requests.
+
+    The WAL journal lets readers run while a write commits, and the busy
+    ``timeout`` makes writers queue for the lock instead of failing.
+    Transactions begin IMMEDIATE, taking the write lock up front: a
+    deferred one that read first and then writes fails with "database is
+    locked" at once if another write committed in between, whatever the
+    timeout. ``journal_mode`` and ``transaction_mode`` are read from
+    OPTIONS (the latter as on Django 5.1+).
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.journal_mode = kwargs.pop('journal_mode', 'WAL')
+        self.transaction_mode = kwargs.pop('transaction_mode', 'IMMEDIATE')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.journal_mode:
+            conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            if self.journal_mode.upper() == 'WAL':
+                # Durable at checkpoints rather than at every commit, which
+                # WAL makes safe against corruption.
+                conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}' if self.transaction_mode else 'BEGIN')